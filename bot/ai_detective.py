@@ -1,102 +1,474 @@
-import os
-from typing import Dict, List, Any
-from transformers import pipeline
-import openai
-import spacy
+import functools
+import logging
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple
 import numpy as np
+from bot.batching import MicroBatcher
+from bot.cache import ResultCache
+from bot.chunking import (
+    aggregate_entities, aggregate_sentiment, iter_chunks, model_token_limit, token_counter
+)
+from bot.config import Config
+from bot.context import AnalysisContext, ContextCache
+from bot.executor import BoundedPool, QueueFullError
+from bot.features import deception_inputs, doc_features, feature_matrix, writing_patterns
+from bot.backends import load_pipeline
+from bot.lazy import lazy_property, timed
+from bot.llm import get_client
+from bot.metrics import STAGE_LATENCY
+from bot.ratelimit import CHEAP
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+NER_MODEL = "dbmdz/bert-large-cased-finetuned-conll03-english"
+SPACY_MODEL = "en_core_web_sm"
+
+# Analysis tiers: cheap stages always run, expensive ones only when warranted
+CHEAP_STAGES = ('sentiment', 'fast_entities', 'deception', 'patterns')
+EXPENSIVE_STAGES = ('entities', 'insights')
+
+# Stages that read other stages' results; every other stage is independent
+STAGE_DEPENDENCIES = {
+    'insights': ('sentiment', 'deception', 'entities'),
+}
+
+# Stages whose results are kept in the analysis ResultCache across messages
+# (and restarts, with CACHE_DIR); the cheap ones are faster to recompute
+CACHED_STAGES = EXPENSIVE_STAGES
+
+# Stages that mostly wait on a remote API; the rest are local CPU-bound inference
+NETWORK_STAGES = ('insights',)
+
+def stage_dependencies(stage: str, stages: Sequence[str]) -> Tuple[str, ...]:
+    """What `stage` waits for; insights uses the cheap spaCy entities
+    unless the full NER stage is part of the same run"""
+    return tuple(
+        'fast_entities' if dep == 'entities' and 'entities' not in stages else dep
+        for dep in STAGE_DEPENDENCIES.get(stage, ())
+    )
+
+def plan_stages(text: str, deep: bool = False) -> List[str]:
+    """
+    Pick the stages worth running for this text.
+    Cheap stages always run; the large NER model and the LLM insight
+    call only run for longer texts or when the user asks for them.
+    """
+    stages = list(CHEAP_STAGES)
+    if deep or len(text.split()) >= Config.DEEP_ANALYSIS_MIN_WORDS:
+        stages.extend(EXPENSIVE_STAGES)
+    return stages
 
 class AIDetective:
-    def __init__(self):
-        self.sentiment_analyzer = pipeline(
-            "sentiment-analysis",
-            model="distilbert-base-uncased-finetuned-sst-2-english"
-        )
-        self.ner_pipeline = pipeline(
-            "ner",
-            model="dbmdz/bert-large-cased-finetuned-conll03-english",
-            aggregation_strategy="simple"
+    def __init__(self, pools: Optional[Dict[str, BoundedPool]] = None):
+        # Models are loaded on first use (see warm_up) so constructing the
+        # detective, and importing the package, is instant
+        self.llm = get_client()
+
+        # Concurrent handler calls are merged into batched forward passes
+        batch_size, wait_ms = Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT_MS
+        self.sentiment_batcher = MicroBatcher(self._sentiment_batch, batch_size, wait_ms, 'sentiment')
+        self.ner_batcher = MicroBatcher(self._ner_batch, batch_size, wait_ms, 'ner')
+        self.nlp_batcher = MicroBatcher(self._nlp_batch, batch_size, wait_ms, 'spacy')
+        self.contexts = ContextCache(self._parse, Config.CONTEXT_CACHE_SIZE, Config.MAX_ANALYSIS_CHARS)
+        self.stage_latency = defaultdict(lambda: deque(maxlen=512))
+        # Stages run on the 'model' and 'network' pools; the bot passes the
+        # InferenceExecutor's, so stage work and every other inference call
+        # share one set of MODEL_*/NETWORK_* limits
+        self.stage_pools = pools or {
+            'model': BoundedPool('stage-model', Config.MODEL_WORKERS, Config.MODEL_QUEUE_SIZE,
+                                 Config.EXPENSIVE_QUEUE_SHARE),
+            'network': BoundedPool('stage-network', Config.NETWORK_WORKERS, Config.NETWORK_QUEUE_SIZE,
+                                   Config.EXPENSIVE_QUEUE_SHARE)
+        }
+        self.stage_failures = defaultdict(int)
+        self.cache = ResultCache(
+            'analysis',
+            version=f"{SENTIMENT_MODEL}:{Config.SENTIMENT_BACKEND}|"
+                    f"{NER_MODEL}:{Config.NER_BACKEND}|{Config.OPENAI_MODEL}"
         )
-        self.nlp = spacy.load("en_core_web_sm")
-        openai.api_key = os.getenv('OPENAI_API_KEY')
-        self.deception_model = self._load_deception_model()
+
+    @lazy_property
+    def sentiment_analyzer(self):
+        return load_pipeline("sentiment-analysis", SENTIMENT_MODEL, Config.SENTIMENT_BACKEND)
+
+    @lazy_property
+    def ner_pipeline(self):
+        return load_pipeline("ner", NER_MODEL, Config.NER_BACKEND, aggregation_strategy="simple")
+
+    @lazy_property
+    def nlp(self):
+        with timed('import spacy'):
+            import spacy
+        return spacy.load(SPACY_MODEL)
+
+    @lazy_property
+    def deception_model(self):
+        return self._load_deception_model()
+
+    def warm_up(self):
+        """Load every model now instead of on the first request"""
+        self.nlp
+        self.sentiment_analyzer
+        self.deception_model
+        self.ner_pipeline
+
+    def context(self, text: str) -> AnalysisContext:
+        """Shared per-message context (one spaCy parse, memoized stage results)"""
+        return self.contexts.get(text)
 
     def analyze(self, text: str) -> Dict[str, Any]:
-        """Comprehensive text analysis"""
-        sentiment = self._analyze_sentiment(text)
-        entities = self._extract_entities(text)
-        deception = self._detect_deception(text)
-        patterns = self._detect_patterns(text)
-        insights = self._get_insights(text, sentiment, entities, deception)
-        
-        return {
-            'sentiment': sentiment,
-            'entities': entities,
-            'deception_score': deception,
-            'writing_patterns': patterns,
-            'insights': insights,
-            'raw_text': text
-        }
+        """Comprehensive text analysis (partial reports are not cached)"""
+        key = self.cache.key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        report = self.run_stages(text, CHEAP_STAGES + EXPENSIVE_STAGES)
+        if 'incomplete' not in report:
+            self.cache.set(key, report)
+        return report
+
+    def analyze_batch(self, texts: List[str], stages: Sequence[str] = CHEAP_STAGES + EXPENSIVE_STAGES,
+                      max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Reports for many texts, with the model stages batched across them.
 
-    def quick_analyze(self, text: str) -> Dict[str, Any]:
-        """Fast analysis for real-time responses"""
-        sentiment = self._analyze_sentiment(text)
-        entities = self._extract_key_entities(text)
-        
+        All texts are parsed in one spaCy batch, the sentiment and NER chunks
+        of every text go through one `map` each, and deception is scored with
+        one predict call; the results are memoized on the contexts, so the
+        per-text stage graphs that follow only run what is left (the LLM
+        insights), up to `max_concurrency` texts at a time.
+        """
+        contexts = [self.context(text) for text in texts]
+        self._parse_many(contexts)
+        if 'sentiment' in stages:
+            todo = [ctx for ctx in contexts if 'sentiment' not in ctx.results]
+            for ctx, (chunks, results) in zip(todo, self._map_chunks(
+                    todo, self.sentiment_analyzer.tokenizer, self.sentiment_batcher)):
+                sentiment = aggregate_sentiment(results, [len(chunk) for chunk in chunks])
+                ctx.memo('sentiment', lambda sentiment=sentiment: sentiment)
+        if 'entities' in stages:
+            todo = [ctx for ctx in contexts if 'entities' not in ctx.results]
+            for ctx, (_, results) in zip(todo, self._map_chunks(
+                    todo, self.ner_pipeline.tokenizer, self.ner_batcher)):
+                entities = aggregate_entities([self._entity_dicts(r) for r in results])
+                ctx.memo('entities', lambda entities=entities: entities)
+        if 'deception' in stages:
+            todo = [ctx for ctx in contexts if 'deception' not in ctx.results]
+            for ctx, score in zip(todo, self.deception_scores([ctx.text for ctx in todo])):
+                ctx.memo('deception', lambda score=score: score)
+
+        workers = min(len(texts), max_concurrency or Config.LLM_MAX_CONCURRENCY) or 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analyze-batch') as pool:
+            return list(pool.map(lambda ctx: self.run_stages(ctx.text, stages, ctx=ctx), contexts))
+
+    def quick_analyze(self, text: str, reject_when_full: bool = False) -> Dict[str, Any]:
+        """Fast analysis for real-time responses; a stage that did not finish is left out"""
+        report = self.run_stages(text, ('sentiment', 'fast_entities'), reject_when_full=reject_when_full)
         return {
-            'sentiment': sentiment['label'],
-            'entities': entities
+            'sentiment': report['sentiment']['label'] if 'sentiment' in report else 'unknown',
+            'entities': self._key_entities(report.get('entities', []))
         }
 
+    def plan(self, text: str, deep: bool = False) -> List[str]:
+        return plan_stages(text, deep)
+
+    def run_stage(self, text: str, stage: str) -> Any:
+        """Run one named stage (memoized per message) and record its latency"""
+        return self._run_stage(self.context(text), stage)
+
+    def _run_stage(self, ctx: AnalysisContext, stage: str) -> Any:
+        return ctx.memo(stage, lambda: self._cached_stage(stage, ctx))
+
+    def _cached_stage(self, stage: str, ctx: AnalysisContext) -> Any:
+        """The stage's result from the analysis cache, or run it and store it"""
+        if stage not in CACHED_STAGES:
+            return self._timed_stage(stage, ctx)
+        # Insights differ depending on which entity stage fed them
+        params = (stage, 'entities' in ctx.results) if stage == 'insights' else (stage,)
+        return self.cache.get_or_compute(ctx.text, lambda: self._timed_stage(stage, ctx), *params)
+
+    def run_stages(self, text: str, stages,
+                   on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                   ctx: Optional[AnalysisContext] = None, priority: str = CHEAP,
+                   reject_when_full: bool = False) -> Dict[str, Any]:
+        """
+        Run stages as a dependency graph on the stage pools.
+
+        Independent stages run concurrently and each stage starts as soon as
+        the stages it depends on are done, so the LLM insight call overlaps
+        nothing but its own inputs. A stage that fails, runs past its timeout
+        (counted from when it starts running), waits in the stage queue for
+        longer than that, or is turned away by a full queue is listed under
+        'incomplete' (with its dependents) instead of failing the whole
+        report. `on_stage(stage, report)` is called as each stage finishes.
+
+        The calling thread only coordinates; stage work is submitted to the
+        pools with `priority`. With `reject_when_full`, a QueueFullError is
+        raised instead when not even the first stage could be queued, so
+        callers can answer with a backpressure reply.
+
+        The context is fetched once and used throughout, so the run does not
+        depend on it staying in the LRU cache.
+        """
+        ctx = ctx or self.context(text)
+        stages = list(dict.fromkeys(stages))
+        for stage in stages:
+            stages.extend(dep for dep in stage_dependencies(stage, stages) if dep not in stages)
+        waiting = [stage for stage in stages if stage not in ctx.results]
+        running: Dict[Future, Tuple[str, float]] = {}
+        started: Dict[str, float] = {}
+        submitted: List[str] = []
+        incomplete: List[str] = []
+
+        def run(stage: str) -> Any:
+            started[stage] = time.monotonic()
+            return self._run_stage(ctx, stage)
+
+        def give_up(stage: str, reason: str):
+            logger.warning(f"Analysis stage {stage} {reason}")
+            self.stage_failures[stage] += 1
+            incomplete.append(stage)
+            finished(stage)
+
+        def finished(stage: str):
+            if on_stage is not None:
+                on_stage(stage, self.report(text, incomplete, ctx))
+
+        def schedule() -> bool:
+            """Submit or drop every waiting stage whose dependencies are settled"""
+            progressed = False
+            for stage in list(waiting):
+                deps = stage_dependencies(stage, stages)
+                if any(dep in incomplete for dep in deps):
+                    waiting.remove(stage)
+                    incomplete.append(stage)
+                    finished(stage)
+                elif all(dep in ctx.results for dep in deps):
+                    waiting.remove(stage)
+                    try:
+                        future = self._stage_pool(stage).submit(functools.partial(run, stage), priority)
+                    except QueueFullError:
+                        if reject_when_full and not submitted:
+                            raise
+                        give_up(stage, "skipped: the stage queue is full")
+                    else:
+                        submitted.append(stage)
+                        # Until it starts, the time allowed in the queue
+                        running[future] = (stage, time.monotonic() + self._stage_timeout(stage))
+                else:
+                    continue
+                progressed = True
+            return progressed
+
+        while waiting or running:
+            while schedule():
+                pass
+            if not running:
+                # Nothing in flight and nothing can start, so nothing will change
+                for stage in waiting:
+                    give_up(stage, "skipped: its dependencies never completed")
+                break
+
+            deadlines = {
+                future: started[stage] + self._stage_timeout(stage) if stage in started else queued_until
+                for future, (stage, queued_until) in running.items()
+            }
+            done, _ = wait(list(running), timeout=max(0.0, min(deadlines.values()) - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future, (stage, _) in list(running.items()):
+                if future in done:
+                    del running[future]
+                    if future.exception() is not None:
+                        logger.error(f"Analysis stage {stage} failed: {future.exception()}")
+                        self.stage_failures[stage] += 1
+                        incomplete.append(stage)
+                    finished(stage)
+                elif now >= deadlines[future]:
+                    if stage not in started and not future.cancel():
+                        # Picked up by a worker just now; its clock starts here
+                        started.setdefault(stage, now)
+                        continue
+                    # A running stage keeps going and memoizes its result for later requests
+                    del running[future]
+                    give_up(stage, f"timed out after {self._stage_timeout(stage)}s"
+                                   f"{'' if stage in started else ' in the stage queue'}")
+        return self.report(text, incomplete, ctx)
+
+    def _stage_pool(self, stage: str) -> BoundedPool:
+        return self.stage_pools['network' if stage in NETWORK_STAGES else 'model']
+
+    def _stage_timeout(self, stage: str) -> float:
+        return Config.STAGE_TIMEOUTS.get(stage, Config.STAGE_TIMEOUT)
+
+    def report(self, text: str, incomplete: Sequence[str] = (),
+               ctx: Optional[AnalysisContext] = None) -> Dict[str, Any]:
+        """Analysis dict built from whichever stages have completed so far"""
+        ctx = ctx or self.context(text)
+        results = ctx.results
+        report = {'raw_text': text}
+        if incomplete:
+            report['incomplete'] = list(incomplete)
+        if ctx.truncated:
+            report['analyzed_chars'] = len(ctx.text)
+        if 'sentiment' in results:
+            report['sentiment'] = results['sentiment']
+        if 'entities' in results or 'fast_entities' in results:
+            report['entities'] = results.get('entities', results.get('fast_entities'))
+        if 'deception' in results:
+            report['deception_score'] = results['deception']
+        if 'patterns' in results:
+            report['writing_patterns'] = results['patterns']
+        if 'insights' in results:
+            report['insights'] = results['insights']
+        return report
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Latency percentiles per stage, for tuning the tier thresholds"""
+        stats = {}
+        for stage, samples in list(self.stage_latency.items()):
+            timings = sorted(samples)
+            if timings:
+                stats[stage] = {
+                    'count': len(timings),
+                    'failures': self.stage_failures[stage],
+                    'p50_ms': round(timings[len(timings) // 2] * 1000, 1),
+                    'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 1)
+                }
+        return stats
+
+    def _timed_stage(self, stage: str, ctx: AnalysisContext) -> Any:
+        start = time.perf_counter()
+        try:
+            return getattr(self, f"_stage_{stage}")(ctx)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_latency[stage].append(elapsed)
+            STAGE_LATENCY.observe(elapsed, component='detective', stage=stage)
+
+    def _stage_sentiment(self, ctx: AnalysisContext) -> Dict[str, Any]:
+        return self._analyze_sentiment(ctx.text)
+
+    def _stage_fast_entities(self, ctx: AnalysisContext) -> List[Dict[str, Any]]:
+        """spaCy entities: much cheaper than the BERT-large NER model"""
+        return [{'word': ent.text, 'entity': ent.label_, 'score': None} for ent in ctx.doc.ents]
+
+    def _stage_entities(self, ctx: AnalysisContext) -> List[Dict[str, Any]]:
+        return self._extract_entities(ctx.text)
+
+    def _stage_deception(self, ctx: AnalysisContext) -> float:
+        return self._detect_deception(ctx)
+
+    def _stage_patterns(self, ctx: AnalysisContext) -> Dict[str, Any]:
+        return self._detect_patterns(ctx)
+
+    def _stage_insights(self, ctx: AnalysisContext) -> str:
+        sentiment = self._run_stage(ctx, 'sentiment')
+        deception = self._run_stage(ctx, 'deception')
+        entities = ctx.results.get('entities') or self._run_stage(ctx, 'fast_entities')
+        return self._get_insights(ctx.text, sentiment, entities, deception)
+
+    def _sentiment_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        # Chunks already fit the window; truncation is only a backstop
+        return self.sentiment_analyzer(texts, batch_size=len(texts), truncation=True)
+
+    def _ner_batch(self, texts: List[str]) -> List[List[Dict[str, Any]]]:
+        return self.ner_pipeline(texts, batch_size=len(texts))
+
+    def _nlp_batch(self, texts: List[str]) -> list:
+        return list(self.nlp.pipe(texts, batch_size=len(texts)))
+
+    def _parse(self, text: str):
+        """spaCy parse routed through the batching scheduler.
+        Long texts are parsed as sentence-aligned pieces in one batch and
+        stitched back into a single Doc."""
+        if len(text) <= Config.PARSE_CHUNK_CHARS:
+            return self.nlp_batcher(text)
+        from spacy.tokens import Doc
+        pieces = list(iter_chunks(text, len, Config.PARSE_CHUNK_CHARS))
+        return Doc.from_docs(self.nlp_batcher.map(pieces))
+
+    def _parse_many(self, contexts: List[AnalysisContext]) -> list:
+        """Docs for many contexts, parsing the short unparsed ones in one batch"""
+        short = [ctx for ctx in contexts
+                 if not ctx.parsed and len(ctx.text) <= Config.PARSE_CHUNK_CHARS]
+        if short:
+            for ctx, doc in zip(short, self.nlp_batcher.map([ctx.text for ctx in short])):
+                ctx.set_doc(doc)
+        return [ctx.doc for ctx in contexts]
+
+    def _chunks(self, text: str, tokenizer) -> List[str]:
+        """Sentence-aligned chunks that fit the model's token window"""
+        limit = model_token_limit(tokenizer)
+        if len(text) <= limit:
+            # Never more tokens than characters, so this fits as-is
+            return [text]
+        return list(iter_chunks(text, token_counter(tokenizer), limit, Config.MAX_ANALYSIS_CHUNKS)) or [text[:limit]]
+
+    def _map_chunks(self, contexts: List[AnalysisContext], tokenizer,
+                    batcher: MicroBatcher) -> List[Tuple[List[str], list]]:
+        """(chunks, results) per context, with every context's chunks in one `map`"""
+        chunked = [self._chunks(ctx.text, tokenizer) for ctx in contexts]
+        results = iter(batcher.map([chunk for chunks in chunked for chunk in chunks]))
+        return [(chunks, [next(results) for _ in chunks]) for chunks in chunked]
+
     def _analyze_sentiment(self, text: str) -> Dict[str, Any]:
-        result = self.sentiment_analyzer(text[:512])[0]
-        return {'label': result['label'], 'score': float(result['score'])}
+        chunks = self._chunks(text, self.sentiment_analyzer.tokenizer)
+        results = self.sentiment_batcher.map(chunks)
+        return aggregate_sentiment(results, [len(chunk) for chunk in chunks])
 
     def _extract_entities(self, text: str) -> List[Dict[str, Any]]:
-        results = self.ner_pipeline(text[:512])
+        chunks = self._chunks(text, self.ner_pipeline.tokenizer)
+        return aggregate_entities([self._entity_dicts(results) for results in self.ner_batcher.map(chunks)])
+
+    def _entity_dicts(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         return [{
             'word': ent['word'],
             'entity': ent['entity_group'],
             'score': float(ent['score'])
         } for ent in results]
 
-    def _extract_key_entities(self, text: str) -> List[str]:
-        doc = self.nlp(text[:512])
-        return [ent.text for ent in doc.ents if ent.label_ in ['PERSON', 'ORG', 'GPE']][:5]
+    def _key_entities(self, entities: List[Dict[str, Any]]) -> List[str]:
+        return [ent['word'] for ent in entities if ent['entity'] in ['PERSON', 'ORG', 'GPE']][:5]
 
-    def _detect_deception(self, text: str) -> float:
+    def _extract_key_entities(self, ctx: AnalysisContext) -> List[str]:
+        return self._key_entities(self._run_stage(ctx, 'fast_entities'))
+
+    def _detect_deception(self, ctx: AnalysisContext) -> float:
         """Analyze text for deception patterns"""
-        features = self._extract_deception_features(text)
-        return float(self.deception_model.predict([features])[0])
+        features = deception_inputs(self._features(ctx)[np.newaxis, :])
+        return float(self.deception_model.predict(features)[0])
+
+    def _features(self, ctx: AnalysisContext) -> np.ndarray:
+        """Feature row shared by the deception and writing-pattern stages"""
+        return ctx.memo('features', lambda: doc_features(ctx.text, ctx.doc))
 
-    def _extract_deception_features(self, text: str) -> List[float]:
+    def _extract_deception_features(self, ctx: AnalysisContext) -> List[float]:
         """Extract linguistic features for deception detection"""
-        doc = self.nlp(text)
-        return [
-            len(text),
-            len(text.split()),
-            sum(1 for _ in doc.sents),
-            sum(1 for token in doc if token.is_punct),
-            sum(1 for token in doc if token.lemma_ in ['i', 'me', 'my']),
-            sum(1 for token in doc if token.lemma_ in ['we', 'us', 'our'])
-        ]
-
-    def _detect_patterns(self, text: str) -> Dict[str, Any]:
+        return deception_inputs(self._features(ctx)[np.newaxis, :])[0].tolist()
+
+    def _detect_patterns(self, ctx: AnalysisContext) -> Dict[str, Any]:
         """Detect writing style patterns"""
-        doc = self.nlp(text)
-        return {
-            'avg_sentence_length': np.mean([len(sent) for sent in doc.sents]),
-            'word_diversity': len(set(token.text for token in doc)) / len(doc),
-            'pos_ratios': {
-                'nouns': sum(1 for token in doc if token.pos_ == 'NOUN') / len(doc),
-                'verbs': sum(1 for token in doc if token.pos_ == 'VERB') / len(doc),
-                'adjectives': sum(1 for token in doc if token.pos_ == 'ADJ') / len(doc)
-            }
-        }
+        return writing_patterns(self._features(ctx))
+
+    def deception_scores(self, texts: List[str]) -> List[float]:
+        """Deception scores for many texts: one batched parse, one predict call"""
+        contexts = [self.context(text) for text in texts]
+        missing = [ctx for ctx in contexts if 'features' not in ctx.results]
+        if missing:
+            rows = feature_matrix([ctx.text for ctx in missing], self._parse_many(missing))
+            for ctx, row in zip(missing, rows):
+                ctx.memo('features', lambda row=row: row)
+        matrix = np.vstack([self._features(ctx) for ctx in contexts])
+        return [float(score) for score in self.deception_model.predict(deception_inputs(matrix))]
 
     def _get_insights(self, text: str, sentiment: Dict, entities: List, deception: float) -> str:
         """Generate human-readable insights"""
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
+        return self.llm.chat_sync(
+            model=Config.OPENAI_MODEL,
             messages=[{
                 "role": "system",
                 "content": (
@@ -117,7 +489,6 @@ class AIDetective:
             temperature=0.7,
             max_tokens=500
         )
-        return response.choices[0].message.content
 
     def _load_deception_model(self):
         """Load deception detection model (placeholder implementation)"""
@@ -125,4 +496,5 @@ class AIDetective:
         model = LogisticRegression()
         model.coef_ = np.array([[0.1, -0.2, 0.05, -0.1, 0.3, -0.15]])
         model.intercept_ = np.array([-0.5])
+        model.classes_ = np.array([0, 1])
         return model
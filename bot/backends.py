@@ -0,0 +1,72 @@
+"""
+Selectable inference backends for the Hugging Face pipelines.
+
+    torch - the stock fp32 PyTorch pipeline
+    int8  - the same pipeline with nn.Linear layers dynamically quantized
+            to int8 (CPU only, no extra dependencies)
+    onnx  - the model exported to ONNX and run with ONNX Runtime
+            (needs `pip install optimum[onnxruntime]`)
+
+Pick one per model via Config.SENTIMENT_BACKEND / NER_BACKEND /
+PARAPHRASE_BACKEND (all default to INFERENCE_BACKEND) and compare them with
+`python -m bot.benchmark backends`.
+"""
+import os
+
+from bot.config import Config
+from bot.lazy import timed
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+# pipeline task -> optimum ONNX Runtime model class
+_ORT_CLASSES = {
+    'sentiment-analysis': 'ORTModelForSequenceClassification',
+    'ner': 'ORTModelForTokenClassification',
+    'text2text-generation': 'ORTModelForSeq2SeqLM',
+}
+
+
+def load_pipeline(task: str, model: str, backend: str = 'torch', **kwargs):
+    """Build a transformers pipeline for `model` on the requested backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+    with timed('import transformers'):
+        from transformers import pipeline
+
+    if backend == 'onnx':
+        ort_model, tokenizer = _load_onnx(task, model)
+        return pipeline(task, model=ort_model, tokenizer=tokenizer, **kwargs)
+
+    pipe = pipeline(task, model=model, **kwargs)
+    if backend == 'int8':
+        import torch
+        pipe.model = torch.quantization.quantize_dynamic(
+            pipe.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return pipe
+
+
+def _load_onnx(task: str, model: str):
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' inference backend needs optimum with ONNX Runtime: "
+            "pip install optimum[onnxruntime]"
+        ) from e
+    from transformers import AutoTokenizer
+
+    model_class = getattr(ort, _ORT_CLASSES[task])
+    export_dir = os.path.join(Config.ONNX_CACHE_DIR, model.replace('/', '--'))
+    if os.path.isdir(export_dir):
+        ort_model = model_class.from_pretrained(export_dir)
+        tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    else:
+        # First run: export once and keep the ONNX graph for later restarts
+        with timed(f'onnx export {model}'):
+            ort_model = model_class.from_pretrained(model, export=True)
+            tokenizer = AutoTokenizer.from_pretrained(model)
+            ort_model.save_pretrained(export_dir)
+            tokenizer.save_pretrained(export_dir)
+    return ort_model, tokenizer
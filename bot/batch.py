@@ -0,0 +1,208 @@
+"""
+Bulk offline analysis of exported chats and datasets.
+
+Streams a JSONL or CSV file through AIDetective without Telegram:
+
+    python -m bot.batch chats.jsonl -o reports.jsonl --workers 4 --no-insights
+
+Records are read lazily and grouped into batches, and each batch goes to
+one of `--workers` processes. Every worker loads the models once and runs
+the batch through `AIDetective.analyze_batch`, so the parse, sentiment,
+NER and deception passes are batched model calls. Reports are appended to
+the output as batches finish (in completion order, tagged with the record
+id), so the output file is the checkpoint: `--resume` skips every record
+whose id is already in it with a complete report. Failed or incomplete
+reports are retried, and the retry's line is appended after them, so
+readers should keep the last line per id.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from bot.ai_detective import CHEAP_STAGES, EXPENSIVE_STAGES
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# (record id, text) pairs
+Batch = List[Tuple[str, str]]
+
+# The worker process's detective, built once by _init_worker
+_detective = None
+_stages: Tuple[str, ...] = ()
+
+
+def read_records(path: str, fmt: str, text_field: str, id_field: str) -> Iterator[Tuple[str, str]]:
+    """Yield (id, text) for every record; the id defaults to the record's position"""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows):
+            text = row.get(text_field)
+            if isinstance(text, str) and text.strip():
+                yield str(row.get(id_field, number)), text
+
+
+def iter_batches(records: Iterator[Tuple[str, str]], batch_size: int, done: Set[str]) -> Iterator[Batch]:
+    batch: Batch = []
+    for record in records:
+        if record[0] in done:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids with a complete report in the output file; failed and incomplete ones are left
+    out so they are retried. A torn last line (from a crash mid-write) is cut off."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            result = json.loads(line)
+            record_id = str(result['id'])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if 'error' in result or 'incomplete' in result:
+            done.discard(record_id)
+        else:
+            done.add(record_id)
+    return done
+
+
+def _init_worker(stages: Tuple[str, ...], batch_size: int, threads: int):
+    global _detective, _stages
+    # Let one batch's chunks form a single forward pass, and keep its contexts resident
+    Config.BATCH_MAX_SIZE = max(Config.BATCH_MAX_SIZE, batch_size)
+    Config.CONTEXT_CACHE_SIZE = max(Config.CONTEXT_CACHE_SIZE, batch_size * 2)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from bot.ai_detective import AIDetective
+    _detective = AIDetective()
+    _detective.warm_up()
+    _stages = stages
+
+
+def _analyze(batch: Batch) -> List[Dict[str, Any]]:
+    """Reports for one batch; if the batched call fails, retry record by record"""
+    texts = [text for _, text in batch]
+    try:
+        reports = _detective.analyze_batch(texts, _stages)
+    except Exception as e:
+        logger.warning(f"Batch of {len(batch)} failed ({e}), analyzing records one at a time")
+        reports = []
+        for text in texts:
+            try:
+                reports.append(_detective.run_stages(text, _stages))
+            except Exception as error:
+                reports.append({'error': str(error)})
+    results = []
+    for (record_id, _), report in zip(batch, reports):
+        report.pop('raw_text', None)
+        results.append({'id': record_id, **report})
+    return results
+
+
+def run(args) -> Dict[str, float]:
+    stages = [s for s in args.stages.split(',') if s and not (args.no_insights and s == 'insights')]
+    done = completed_ids(args.output) if args.resume else set()
+    if done:
+        logger.info(f"Resuming: {len(done)} records already in {args.output}")
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    batches = iter_batches(
+        read_records(args.input, args.format, args.text_field, args.id_field), args.batch_size, done
+    )
+
+    processed = failed = 0
+    started = last_report = time.monotonic()
+    with open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as out, \
+            ProcessPoolExecutor(args.workers, mp_context=get_context('spawn'), initializer=_init_worker,
+                                initargs=(tuple(stages), args.batch_size, threads)) as pool:
+        # Bounded number of batches in flight, so the input is streamed rather than read up front
+        running = set()
+        exhausted = False
+        while running or not exhausted:
+            while not exhausted and len(running) < args.workers * 2:
+                batch = next(batches, None)
+                if batch is None:
+                    exhausted = True
+                else:
+                    running.add(pool.submit(_analyze, batch))
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for result in future.result():
+                    out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    processed += 1
+                    failed += 'error' in result or 'incomplete' in result
+            out.flush()
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval:
+                logger.info(f"{processed} records, {processed / (now - started):.1f} docs/s")
+                last_report = now
+
+    elapsed = time.monotonic() - started
+    return {
+        'processed': processed,
+        'failed': failed,
+        'skipped': len(done),
+        'elapsed_s': round(elapsed, 1),
+        'docs_per_s': round(processed / elapsed, 2) if elapsed else 0.0
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Analyze a JSONL/CSV file of texts with AIDetective")
+    parser.add_argument('input')
+    parser.add_argument('-o', '--output', required=True, help="JSONL file of reports (also the checkpoint)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="Default: from the input's extension")
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--id-field', default='id')
+    parser.add_argument('--stages', default=','.join(CHEAP_STAGES + EXPENSIVE_STAGES))
+    parser.add_argument('--no-insights', action='store_true', help="Skip the LLM insight stage")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--threads', type=int, default=0, help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--resume', action='store_true', help="Skip records already in the output file")
+    parser.add_argument('--progress-interval', type=float, default=10.0)
+    args = parser.parse_args(argv)
+    if args.format is None:
+        args.format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    summary = run(args)
+    logger.info(
+        f"Analyzed {summary['processed']} records ({summary['failed']} incomplete, "
+        f"{summary['skipped']} resumed) in {summary['elapsed_s']}s: {summary['docs_per_s']} docs/s"
+    )
+    json.dump(summary, sys.stdout)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
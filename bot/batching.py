@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+_registry: Dict[str, "MicroBatcher"] = {}
+
+
+def batcher_stats() -> Dict[str, Dict[str, float]]:
+    """Batch size and queue depth for every batcher in the process"""
+    return {name: batcher.stats() for name, batcher in _registry.items()}
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item calls into one batched call.
+
+    Callers block on `__call__` (or wait on the Future from `submit`) while a
+    background thread gathers up to `max_batch_size` items, or whatever
+    arrived within `max_wait_ms` of the first one, and runs `batch_fn` once
+    over the whole list. `batch_fn` must return one result per input, in order.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 name: str = 'batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        _registry[name] = self
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item and return a Future for its result"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def map(self, items: Sequence[Any]) -> List[Any]:
+        """Submit many items at once and wait for all results"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name=f"{self.name}-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Deadline passed: still take anything that is already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self.batches += 1
+                self.items += len(items)
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
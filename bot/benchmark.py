@@ -0,0 +1,558 @@
+"""
+Offline micro-benchmarks for the bot's model pipelines.
+
+Usage:
+    python -m bot.benchmark batching --requests 256 --sizes 1,4,16,32
+    python -m bot.benchmark backends --backends torch,int8,onnx
+    python -m bot.benchmark chunking --docs 20 --sentences 60
+    python -m bot.benchmark features --docs 200 --repeat 5
+    python -m bot.benchmark language --repeat 20 [--googletrans]
+    python -m bot.benchmark speech --backends google,vosk,whisper [--clips a.ogg,b.ogg]
+    python -m bot.benchmark humanize --plans llm,t5,both --requests 8
+    python -m bot.benchmark load --scenarios text,analyze,humanize,voice,mixed --rate 20
+"""
+import argparse
+import resource
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+SAMPLE_TEXTS = [
+    "I was at home all evening, I swear I never left the house.",
+    "The meeting with Acme Corp in London went better than expected.",
+    "Honestly, we didn't take the money. Our team was in Paris that week.",
+    "Barack Obama visited Colombo and met with the Sri Lankan president.",
+    "This product is terrible and customer support never answered my emails.",
+    "We are thrilled to announce our new office in Berlin next spring!",
+    "I think I might have forgotten to lock the door, but I'm not sure.",
+    "Google and Microsoft both reported strong earnings this quarter.",
+]
+
+
+def sample_texts(count: int) -> List[str]:
+    return [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(count)]
+
+
+def _print_table(title: str, rows: List[Dict[str, object]]):
+    print(f"\n{title}")
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(h), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def _throughput(batch_fn: Callable[[List[str]], Sequence], texts: List[str],
+                batch_size: int, wait_ms: float) -> Dict[str, object]:
+    from bot.batching import MicroBatcher
+
+    batcher = MicroBatcher(batch_fn, batch_size, wait_ms, 'benchmark')
+    batcher(texts[0])  # warm up model + thread
+    batcher.batches = batcher.items = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(batch_size * 2, 4)) as pool:
+        list(pool.map(batcher, texts))
+    elapsed = time.perf_counter() - start
+
+    stats = batcher.stats()
+    return {
+        'batch_size': batch_size,
+        'items/s': f"{len(texts) / elapsed:.1f}",
+        'avg_batch': f"{stats['avg_batch_size']:.1f}",
+        'total_s': f"{elapsed:.2f}"
+    }
+
+
+def bench_batching(args):
+    from bot.ai_detective import AIDetective
+
+    detective = AIDetective()
+    texts = sample_texts(args.requests)
+    sizes = [int(s) for s in args.sizes.split(',')]
+    pipelines = {
+        'sentiment': detective._sentiment_batch,
+        'ner': detective._ner_batch,
+        'spacy': detective._nlp_batch,
+    }
+    for name, batch_fn in pipelines.items():
+        rows = [_throughput(batch_fn, texts, size, args.wait_ms) for size in sizes]
+        _print_table(f"{name} ({len(texts)} concurrent requests)", rows)
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _time_per_text(fn: Callable[[str], object], texts: List[str]) -> tuple:
+    fn(texts[0])
+    outputs, timings = [], []
+    for text in texts:
+        start = time.perf_counter()
+        outputs.append(fn(text))
+        timings.append(time.perf_counter() - start)
+    return outputs, statistics.mean(timings) * 1000
+
+
+def _entity_f1(expected: List[list], actual: List[list]) -> float:
+    true_pos = n_expected = n_actual = 0
+    for exp, act in zip(expected, actual):
+        exp_set = {(e['word'], e['entity_group']) for e in exp}
+        act_set = {(e['word'], e['entity_group']) for e in act}
+        true_pos += len(exp_set & act_set)
+        n_expected += len(exp_set)
+        n_actual += len(act_set)
+    if not n_expected and not n_actual:
+        return 1.0
+    return 2 * true_pos / (n_expected + n_actual)
+
+
+def _token_overlap(expected: List[str], actual: List[str]) -> float:
+    scores = []
+    for exp, act in zip(expected, actual):
+        a, b = set(exp.lower().split()), set(act.lower().split())
+        scores.append(len(a & b) / len(a | b) if a | b else 1.0)
+    return statistics.mean(scores)
+
+
+def bench_backends(args):
+    """Latency and accuracy parity of each backend against fp32 torch"""
+    from bot.ai_detective import NER_MODEL, SENTIMENT_MODEL
+    from bot.backends import load_pipeline
+    from bot.humanizer import PARAPHRASE_MODEL
+
+    texts = sample_texts(args.texts)
+    backends = args.backends.split(',')
+    models = {
+        'sentiment': (
+            'sentiment-analysis', SENTIMENT_MODEL, {},
+            lambda pipe, text: pipe(text)[0],
+            lambda exp, act: statistics.mean(
+                e['label'] == a['label'] for e, a in zip(exp, act)
+            ),
+        ),
+        'ner': (
+            'ner', NER_MODEL, {'aggregation_strategy': 'simple'},
+            lambda pipe, text: pipe(text),
+            _entity_f1,
+        ),
+        'paraphrase': (
+            'text2text-generation', PARAPHRASE_MODEL, {},
+            lambda pipe, text: pipe(f"paraphrase: {text}", max_new_tokens=64,
+                                    do_sample=False)[0]['generated_text'],
+            _token_overlap,
+        ),
+    }
+
+    for name in args.models.split(','):
+        task, model, kwargs, run, parity = models[name]
+        rows, baseline = [], None
+        for backend in ['torch'] + [b for b in backends if b != 'torch']:
+            rss_before = _rss_mb()
+            try:
+                pipe = load_pipeline(task, model, backend, **kwargs)
+            except ImportError as e:
+                print(f"Skipping {name}/{backend}: {e}")
+                continue
+            outputs, latency = _time_per_text(lambda t: run(pipe, t), texts)
+            if baseline is None:
+                baseline = outputs
+            rows.append({
+                'backend': backend,
+                'ms/text': f"{latency:.1f}",
+                'parity': f"{parity(baseline, outputs):.3f}",
+                'peak_rss_mb': f"{_rss_mb():.0f} (+{_rss_mb() - rss_before:.0f})"
+            })
+            del pipe
+        _print_table(f"{name}: {model} ({len(texts)} texts)", rows)
+
+
+def sample_documents(count: int, sentences: int) -> List[str]:
+    """Long pasted-document style inputs built from the sample sentences"""
+    docs = []
+    for i in range(count):
+        picked = [SAMPLE_TEXTS[(i * 3 + j * (i + 1)) % len(SAMPLE_TEXTS)] for j in range(sentences)]
+        docs.append(' '.join(picked))
+    return docs
+
+
+def bench_chunking(args):
+    """Chunked analysis vs the old text[:512] truncation on long documents.
+
+    The reference is every sentence analyzed on its own (length-weighted
+    sentiment, union of entities), i.e. what a perfect chunker would see.
+    """
+    from bot.ai_detective import AIDetective
+    from bot.chunking import aggregate_entities, aggregate_sentiment, split_sentences
+
+    detective = AIDetective()
+    detective.warm_up()
+    docs = sample_documents(args.docs, args.sentences)
+
+    def to_entities(results):
+        return [{'word': e['word'], 'entity': e['entity_group'], 'score': float(e['score'])}
+                for e in results]
+
+    def truncated(text):
+        result = detective.sentiment_analyzer(text[:512])[0]
+        sentiment = {'label': result['label'], 'score': float(result['score'])}
+        return sentiment, to_entities(detective.ner_pipeline(text[:512]))
+
+    def chunked(text):
+        return detective._analyze_sentiment(text), detective._extract_entities(text)
+
+    references = []
+    for doc in docs:
+        sentences = split_sentences(doc)
+        sentiment = aggregate_sentiment(
+            detective.sentiment_analyzer(sentences), [len(s) for s in sentences]
+        )
+        entities = aggregate_entities([to_entities(r) for r in detective.ner_pipeline(sentences)])
+        references.append((sentiment, {(e['word'], e['entity']) for e in entities}))
+
+    rows = []
+    for name, fn in (('truncate-512', truncated), ('chunked', chunked)):
+        start = time.perf_counter()
+        outputs = [fn(doc) for doc in docs]
+        elapsed = time.perf_counter() - start
+        label_match = statistics.mean(
+            out[0]['label'] == ref[0]['label'] for out, ref in zip(outputs, references)
+        )
+        recalls = []
+        for out, ref in zip(outputs, references):
+            found = {(e['word'], e['entity']) for e in out[1]}
+            recalls.append(len(found & ref[1]) / len(ref[1]) if ref[1] else 1.0)
+        rows.append({
+            'method': name,
+            'ms/doc': f"{elapsed / len(docs) * 1000:.1f}",
+            'sentiment_match': f"{label_match:.2f}",
+            'entity_recall': f"{statistics.mean(recalls):.2f}"
+        })
+    avg_chars = statistics.mean(len(doc) for doc in docs)
+    _print_table(f"Long-text analysis ({len(docs)} docs, ~{avg_chars:.0f} chars each)", rows)
+
+
+def _legacy_features(text: str, doc) -> List[float]:
+    """The per-token generator version the vectorized extractor replaced"""
+    tokens = len(doc)
+    return [
+        len(text),
+        len(text.split()),
+        sum(1 for _ in doc.sents),
+        sum(1 for token in doc if token.is_punct),
+        sum(1 for token in doc if token.lemma_ in ['i', 'me', 'my']),
+        sum(1 for token in doc if token.lemma_ in ['we', 'us', 'our']),
+        statistics.mean([len(sent) for sent in doc.sents]),
+        len(set(token.text for token in doc)) / tokens,
+        sum(1 for token in doc if token.pos_ == 'NOUN') / tokens,
+        sum(1 for token in doc if token.pos_ == 'VERB') / tokens,
+        sum(1 for token in doc if token.pos_ == 'ADJ') / tokens,
+    ]
+
+
+def _vectorized_features(text: str, doc) -> List[float]:
+    from bot.features import DECEPTION_FEATURES, doc_features, writing_patterns
+
+    row = doc_features(text, doc)
+    patterns = writing_patterns(row)
+    return row[:len(DECEPTION_FEATURES)].tolist() + [
+        patterns['avg_sentence_length'],
+        patterns['word_diversity'],
+        *patterns['pos_ratios'].values()
+    ]
+
+
+def bench_features(args):
+    """Deception/pattern feature extraction: token loops vs Doc.to_array"""
+    import numpy as np
+    from bot.ai_detective import AIDetective
+    from bot.features import deception_inputs, feature_matrix
+
+    detective = AIDetective()
+    model = detective.deception_model
+    inputs = {
+        'short': sample_texts(args.docs),
+        'long': sample_documents(max(1, args.docs // 10), 60),
+    }
+    rows = []
+    for size, texts in inputs.items():
+        docs = detective._nlp_batch(texts)
+        legacy = np.array([_legacy_features(t, d) for t, d in zip(texts, docs)])
+        vectorized = np.array([_vectorized_features(t, d) for t, d in zip(texts, docs)])
+        max_diff = float(np.abs(legacy - vectorized).max())
+
+        def per_doc_legacy():
+            for text, doc in zip(texts, docs):
+                model.predict([_legacy_features(text, doc)[:6]])
+
+        def per_doc_vectorized():
+            for text, doc in zip(texts, docs):
+                model.predict([_vectorized_features(text, doc)[:6]])
+
+        def batched():
+            model.predict(deception_inputs(feature_matrix(texts, docs)))
+
+        for name, fn in (('legacy', per_doc_legacy), ('vectorized', per_doc_vectorized),
+                         ('batched', batched)):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - start)
+            rows.append({
+                'input': f"{size} ({statistics.mean(len(d) for d in docs):.0f} tok)",
+                'method': name,
+                'us/doc': f"{min(timings) / len(texts) * 1e6:.1f}",
+                'max_diff': f"{max_diff:.2g}" if name != 'legacy' else '-'
+            })
+    _print_table(f"Feature extraction + deception predict (best of {args.repeat})", rows)
+
+
+LANGUAGE_SAMPLES = {
+    'en': ["Where is the nearest train station?", "I have been waiting for your reply all day."],
+    'si': ["ඔබට කොහොමද?", "මම හෙට කොළඹ යනවා."],
+    'ta': ["நீங்கள் எப்படி இருக்கிறீர்கள்?", "நான் நாளை சென்னைக்கு போகிறேன்."],
+    'fr': ["Où se trouve la gare la plus proche ?", "J'ai attendu ta réponse toute la journée."],
+    'es': ["¿Dónde está la estación de tren más cercana?", "He esperado tu respuesta todo el día."],
+    'de': ["Wo ist der nächste Bahnhof?", "Ich habe den ganzen Tag auf deine Antwort gewartet."],
+    'it': ["Dov'è la stazione ferroviaria più vicina?", "Ho aspettato la tua risposta tutto il giorno."],
+    'ru': ["Где ближайшая железнодорожная станция?", "Я весь день ждал твоего ответа."],
+    'zh-cn': ["最近的火车站在哪里？", "我等了你一整天的回复。"],
+    'ja': ["一番近い駅はどこですか？", "一日中あなたの返事を待っていました。"],
+    'ko': ["가장 가까운 기차역이 어디예요?", "하루 종일 당신의 답장을 기다렸어요."],
+}
+
+
+def bench_language(args):
+    """Latency and accuracy of language detection on the bot's languages"""
+    from bot.language import LanguageDetector
+
+    detector = LanguageDetector()
+    detector.factory  # load profiles outside the timed loop
+    methods = {'local': lambda text: detector.detect(text)[0]}
+    if args.googletrans:
+        from googletrans import Translator
+        translator = Translator()
+        methods['googletrans'] = lambda text: translator.detect(text).lang.lower()
+
+    rows = []
+    for name, detect in methods.items():
+        correct = total = 0
+        timings = []
+        for code, texts in LANGUAGE_SAMPLES.items():
+            for text in texts:
+                for _ in range(args.repeat if name == 'local' else 1):
+                    start = time.perf_counter()
+                    found = detect(text)
+                    timings.append(time.perf_counter() - start)
+                correct += found == code
+                total += 1
+        timings.sort()
+        rows.append({
+            'method': name,
+            'accuracy': f"{correct / total:.2f}",
+            'p50_ms': f"{timings[len(timings) // 2] * 1000:.2f}",
+            'p95_ms': f"{timings[int(len(timings) * 0.95)] * 1000:.2f}"
+        })
+    _print_table(f"Language detection ({len(LANGUAGE_SAMPLES)} languages)", rows)
+
+
+def _word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    distances = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1, distances[j - 1] + 1, previous + (ref_word != hyp_word)
+            )
+    return distances[len(hyp)] / max(1, len(ref))
+
+
+def _speech_clips(paths: str) -> List[tuple]:
+    """(name, ogg bytes, reference transcript or None) for every sample clip"""
+    if paths:
+        clips = []
+        for path in paths.split(','):
+            with open(path, 'rb') as f:
+                clips.append((path, f.read(), None))
+        return clips
+    # No clips given: synthesize spoken versions of the sample texts (gTTS, network)
+    import io
+    from gtts import gTTS
+    clips = []
+    for i in range(0, len(SAMPLE_TEXTS), 2):
+        text = ' '.join(SAMPLE_TEXTS[i:i + 2])
+        buffer = io.BytesIO()
+        gTTS(text).write_to_fp(buffer)
+        clips.append((f"sample{i // 2}", buffer.getvalue(), text))
+    return clips
+
+
+def bench_speech(args):
+    """Real-time factor (processing time / audio duration) per recognizer backend"""
+    import re
+    from bot.config import Config
+    from bot.voice import VoiceProcessor, create_recognizer
+
+    punctuation = re.compile(r"[^\w\s']")
+    clips = _speech_clips(args.clips)
+    rows = []
+    audio_seconds = None
+    for name in args.backends.split(','):
+        processor = VoiceProcessor(create_recognizer(name))
+        processor.warm_up()
+        if audio_seconds is None:
+            audio_seconds = sum(
+                len(audio.get_raw_data()) / audio.sample_width / audio.sample_rate
+                for audio in (processor.decode(data) for _, data, _ in clips)
+            )
+        transcribers = {
+            'single': lambda data: processor.backend.transcribe(processor.decode(data)),
+            'chunked': lambda data: processor.transcribe_chunks(processor.prepare(data)),
+        }
+        for mode, transcribe in transcribers.items():
+            elapsed, errors = 0.0, []
+            for _, data, reference in clips:
+                start = time.perf_counter()
+                text = transcribe(data)
+                elapsed += time.perf_counter() - start
+                if reference:
+                    errors.append(_word_error_rate(punctuation.sub('', reference), punctuation.sub('', text)))
+            rows.append({
+                'backend': name,
+                'mode': mode,
+                'audio_s': f"{audio_seconds:.1f}",
+                'rtf': f"{elapsed / audio_seconds:.3f}",
+                'wer': f"{statistics.mean(errors):.2f}" if errors else '-'
+            })
+    _print_table(f"Speech recognition ({len(clips)} clips, workers={Config.VOICE_WORKERS})", rows)
+
+
+def bench_humanize(args):
+    """Latency and LLM token cost of each humanization plan (cold and cached)"""
+    from bot.humanizer import STYLE_MODEL, Humanizer
+
+    humanizer = Humanizer()
+    humanizer.warm_up()
+    inputs = {
+        'short': sample_texts(args.requests),
+        'long': sample_documents(max(1, args.requests // 4), 20),
+    }
+
+    def style_tokens():
+        counts = humanizer.llm.stats()['tokens'].get(STYLE_MODEL, {})
+        return counts.get('prompt', 0) + counts.get('completion', 0)
+
+    rows = []
+    for plan in args.plans.split(','):
+        for size, texts in inputs.items():
+            humanizer.style_cache.clear()
+            humanizer.paraphrase_cache.clear()
+            tokens_before, chunks_before = style_tokens(), humanizer.paraphrase_batcher.items
+
+            start = time.perf_counter()
+            for text in texts:
+                humanizer.humanize(text, style='professional', plan=plan)
+            cold = time.perf_counter() - start
+            tokens = style_tokens() - tokens_before
+            chunks = humanizer.paraphrase_batcher.items - chunks_before
+
+            start = time.perf_counter()
+            for text in texts:
+                humanizer.humanize(text, style='professional', plan=plan)
+            cached = time.perf_counter() - start
+
+            rows.append({
+                'plan': plan,
+                'input': size,
+                'cold_ms/req': f"{cold / len(texts) * 1000:.0f}",
+                'cached_ms/req': f"{cached / len(texts) * 1000:.0f}",
+                't5_chunks/req': f"{chunks / len(texts):.1f}",
+                'llm_tokens/req': f"{tokens / len(texts):.0f}",
+                'usd/1k_req': f"{tokens / len(texts) * args.usd_per_1k_tokens:.2f}"
+            })
+    _print_table("Humanizer plans ('professional' style, which is cacheable by default)", rows)
+
+
+def bench_load(args):
+    """Handler latency, throughput and memory under synthetic Telegram traffic"""
+    from bot.loadtest import run_load_test
+
+    rows = run_load_test(args)
+    rate = f"{args.rate:g}/s" if args.rate else 'unthrottled'
+    _print_table(
+        f"Load test ({args.updates} updates per scenario at {rate}, concurrency {args.concurrency}, "
+        f"peak RSS {_rss_mb():.0f} MB)", rows
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Detective benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    batching = sub.add_parser('batching', help="Micro-batching throughput per batch size")
+    batching.add_argument('--requests', type=int, default=256)
+    batching.add_argument('--sizes', default='1,2,4,8,16,32')
+    batching.add_argument('--wait-ms', type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    backends = sub.add_parser('backends', help="Backend latency and accuracy parity vs fp32 torch")
+    backends.add_argument('--backends', default='torch,int8,onnx')
+    backends.add_argument('--models', default='sentiment,ner,paraphrase')
+    backends.add_argument('--texts', type=int, default=32)
+    backends.set_defaults(func=bench_backends)
+
+    chunking = sub.add_parser('chunking', help="Chunked long-text analysis vs 512-char truncation")
+    chunking.add_argument('--docs', type=int, default=20)
+    chunking.add_argument('--sentences', type=int, default=60)
+    chunking.set_defaults(func=bench_chunking)
+
+    features = sub.add_parser('features', help="Vectorized vs per-token feature extraction")
+    features.add_argument('--docs', type=int, default=200)
+    features.add_argument('--repeat', type=int, default=5)
+    features.set_defaults(func=bench_features)
+
+    language = sub.add_parser('language', help="Offline language detection latency and accuracy")
+    language.add_argument('--repeat', type=int, default=20)
+    language.add_argument('--googletrans', action='store_true', help="Also time the network detector")
+    language.set_defaults(func=bench_language)
+
+    speech = sub.add_parser('speech', help="Real-time factor of each speech recognition backend")
+    speech.add_argument('--backends', default='google')
+    speech.add_argument('--clips', default='', help="Comma-separated audio files (default: gTTS samples)")
+    speech.set_defaults(func=bench_speech)
+
+    humanize = sub.add_parser('humanize', help="Latency and cost of the humanization plans")
+    humanize.add_argument('--plans', default='llm,t5,both')
+    humanize.add_argument('--requests', type=int, default=8)
+    humanize.add_argument('--usd-per-1k-tokens', type=float, default=0.002)
+    humanize.set_defaults(func=bench_humanize)
+
+    load = sub.add_parser('load', help="Replay synthetic Telegram traffic against fake network services")
+    load.add_argument('--scenarios', default='text,analyze,humanize,translate,voice,mixed')
+    load.add_argument('--updates', type=int, default=200, help="Updates per scenario")
+    load.add_argument('--rate', type=float, default=20.0, help="Updates per second (0 = as fast as possible)")
+    load.add_argument('--concurrency', type=int, default=64, help="Max updates in flight")
+    load.add_argument('--users', type=int, default=50)
+    load.add_argument('--voice-seconds', type=float, default=8.0)
+    load.add_argument('--telegram-ms', type=float, default=30.0, help="Fake Bot API latency per call")
+    load.add_argument('--openai-ms', type=float, default=800.0, help="Fake OpenAI time to first token")
+    load.add_argument('--openai-token-ms', type=float, default=5.0, help="Fake OpenAI delay per streamed token")
+    load.add_argument('--translate-ms', type=float, default=150.0, help="Fake googletrans latency per bulk call")
+    load.add_argument('--speech-ms', type=float, default=300.0, help="Fake recognizer latency per chunk")
+    load.add_argument('--rate-limit', action='store_true', help="Keep the configured rate limits")
+    load.add_argument('--no-warm-up', dest='warm_up', action='store_false',
+                      help="Include model loading in the first scenario")
+    load.add_argument('--seed', type=int, default=0)
+    load.set_defaults(func=bench_load)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
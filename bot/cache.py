@@ -0,0 +1,229 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Every ResultCache registers itself here so stats can be reported in one place
+_registry: Dict[str, "ResultCache"] = {}
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies share a cache entry"""
+    return ' '.join(text.split())
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss/size counters for every cache in the process"""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+class ResultCache:
+    """
+    Content-addressed result cache with LRU + TTL eviction.
+
+    Keys are a SHA-256 of the normalized text, the cache namespace, a
+    version string (bump it when models or prompts change) and any extra
+    parameters. Values are stored pickled, which gives an exact byte size for
+    the `max_bytes` cap and keeps callers from mutating cached results. When
+    `disk_dir` is set, entries are also written there and survive restarts;
+    once the files pass `disk_max_bytes`, writes prune the expired and then
+    the least recently written ones.
+    """
+
+    def __init__(self, namespace: str, version: str = '',
+                 max_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 disk_dir: Optional[str] = None, disk_max_bytes: Optional[int] = None):
+        self.namespace = namespace
+        self.version = f"{Config.CACHE_VERSION}:{version}"
+        self.max_bytes = Config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = Config.CACHE_TTL if ttl is None else ttl
+        disk_dir = Config.CACHE_DIR if disk_dir is None else disk_dir
+        self.disk_dir = os.path.join(disk_dir, namespace) if disk_dir else None
+        self.disk_max_bytes = Config.CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self.disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.disk_bytes = sum(size for _, _, size in self._disk_files())
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[namespace] = self
+
+    def key(self, text: str, *params: Any) -> str:
+        digest = hashlib.sha256()
+        for part in (self.namespace, self.version, normalize_text(text), *map(repr, params)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, blob = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(blob)
+                self._drop(key)
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            # Keeps the expiry it was written with, not a fresh TTL
+            expires, blob = entry
+            self._put(key, blob, expires)
+        return pickle.loads(blob)
+
+    def set(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put(key, blob, expires)
+        self._disk_set(key, blob, expires)
+
+    def get_or_compute(self, text: str, compute: Callable[[], Any], *params: Any) -> Any:
+        """Return the cached value for (text, params) or compute and store it.
+
+        Exceptions from `compute` propagate and nothing is cached.
+        """
+        key = self.key(text, *params)
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'disk_bytes': self.disk_bytes,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def _put(self, key: str, blob: bytes, expires: float):
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires, blob)
+        self.bytes += len(blob)
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        _, blob = self._entries.pop(key)
+        self.bytes -= len(blob)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, blob = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read cache entry {path}: {e}")
+            return None
+        if expires < now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return expires, blob
+
+    def _disk_set(self, key: str, blob: bytes, expires: float):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((expires, blob), f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write cache entry {path}: {e}")
+            return
+        with self._disk_lock:
+            self.disk_bytes += size
+        if self.disk_bytes > self.disk_max_bytes:
+            self._disk_prune()
+
+    def _disk_files(self) -> List[Tuple[float, str, int]]:
+        """(mtime, path, size) of every entry file"""
+        files = []
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        return files
+
+    def _disk_prune(self):
+        """Bring the disk tier down to 90% of its cap: expired entries first, then the oldest"""
+        if not self._disk_lock.acquire(blocking=False):
+            return  # another writer is already pruning
+        try:
+            now = time.time()
+            files = self._disk_files()
+            total = sum(size for _, _, size in files)
+            target = self.disk_max_bytes * 0.9
+            # Files are written with a fixed TTL, so mtime order is expiry order
+            for mtime, path, size in sorted(files):
+                if total <= target and mtime + self.ttl >= now:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+            self.disk_bytes = total
+        except OSError as e:
+            logger.warning(f"Failed to prune cache directory {self.disk_dir}: {e}")
+        finally:
+            self._disk_lock.release()
@@ -0,0 +1,131 @@
+"""
+Sentence-aware chunking for texts longer than a model's input window.
+
+Instead of silently cutting input at 512 characters, long texts are split
+on sentence boundaries into chunks that fit the model's token limit,
+analyzed in batches, and the per-chunk results are aggregated.
+"""
+import re
+from typing import Callable, Dict, Iterator, List, Tuple
+
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+|\n{2,}')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Cheap regex sentence splitter (no model needed)"""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def clip_text(text: str, max_chars: int) -> str:
+    """Cut text to max_chars, preferring the last sentence boundary before the cut"""
+    if len(text) <= max_chars:
+        return text
+    clipped = text[:max_chars]
+    boundary = max(clipped.rfind('. '), clipped.rfind('! '), clipped.rfind('? '), clipped.rfind('\n'))
+    if boundary > max_chars // 2:
+        clipped = clipped[:boundary + 1]
+    return clipped
+
+
+def _hard_split(word: str, count: Callable[[str], int], max_units: int) -> Iterator[Tuple[str, int]]:
+    """Cut a piece with no whitespace into windows within `max_units`.
+    A window starts at `max_units` characters (never more tokens than that for
+    WordPiece models) and is halved until it fits."""
+    start = 0
+    while start < len(word):
+        end = start + max_units
+        size = count(word[start:end])
+        while size > max_units and end - start > 1:
+            end = start + (end - start) // 2
+            size = count(word[start:end])
+        yield word[start:end], size
+        start = end
+
+
+def iter_chunks(text: str, count: Callable[[str], int], max_units: int,
+                max_chunks: int = 0) -> Iterator[str]:
+    """
+    Yield chunks of whole sentences whose `count` stays within `max_units`.
+
+    `count` measures a piece of text (model tokens, characters, ...).
+    Sentences that are too long on their own are split on whitespace, and
+    words that are still too long are cut into windows, so no chunk is over.
+    Stops after `max_chunks` chunks when that is set.
+    """
+    produced = 0
+    current: List[str] = []
+    current_size = 0
+    separator = count(' ')
+
+    def pieces():
+        for sentence in split_sentences(text):
+            size = count(sentence)
+            if size <= max_units:
+                yield sentence, size
+                continue
+            # Over-long sentence: fall back to packing words
+            part, part_size = [], 0
+            for word in sentence.split():
+                word_size = count(word)
+                if word_size > max_units:
+                    # No spaces to split on (CJK, Thai, URLs, base64...): cut by window
+                    if part:
+                        yield ' '.join(part), part_size
+                        part, part_size = [], 0
+                    yield from _hard_split(word, count, max_units)
+                    continue
+                if part and part_size + separator + word_size > max_units:
+                    yield ' '.join(part), part_size
+                    part, part_size = [], 0
+                part_size += word_size + (separator if part else 0)
+                part.append(word)
+            if part:
+                yield ' '.join(part), part_size
+
+    for sentence, size in pieces():
+        if current and current_size + separator + size > max_units:
+            yield ' '.join(current)
+            produced += 1
+            if max_chunks and produced >= max_chunks:
+                return
+            current, current_size = [], 0
+        current_size += size + (separator if current else 0)
+        current.append(sentence)
+    if current:
+        yield ' '.join(current)
+
+
+def token_counter(tokenizer) -> Callable[[str], int]:
+    """Count model tokens (without special tokens) using a HF tokenizer"""
+    return lambda piece: len(tokenizer.tokenize(piece))
+
+
+def model_token_limit(tokenizer, default: int = 512) -> int:
+    """Usable tokens per chunk once [CLS]/[SEP]-style special tokens are added"""
+    limit = getattr(tokenizer, 'model_max_length', default)
+    if not limit or limit > 100000:  # HF uses a huge sentinel when unknown
+        limit = default
+    return limit - tokenizer.num_special_tokens_to_add()
+
+
+def aggregate_sentiment(results: List[Dict], weights: List[int]) -> Dict:
+    """Length-weighted sentiment over chunks (binary POSITIVE/NEGATIVE head)"""
+    total = sum(weights) or 1
+    positive = sum(
+        (r['score'] if r['label'] == 'POSITIVE' else 1.0 - r['score']) * w
+        for r, w in zip(results, weights)
+    ) / total
+    if positive >= 0.5:
+        return {'label': 'POSITIVE', 'score': float(positive)}
+    return {'label': 'NEGATIVE', 'score': float(1.0 - positive)}
+
+
+def aggregate_entities(chunk_results: List[List[Dict]]) -> List[Dict]:
+    """Merge per-chunk entities, keeping the best score for each (word, type)"""
+    best: Dict[Tuple[str, str], Dict] = {}
+    for entities in chunk_results:
+        for entity in entities:
+            key = (entity['word'], entity['entity'])
+            if key not in best or entity['score'] > best[key]['score']:
+                best[key] = entity
+    return sorted(best.values(), key=lambda e: -e['score'])
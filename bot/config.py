@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from typing import Dict, Any, Optional
+from typing import Dict, Any
 import logging
 
 # Load environment variables from .env file
@@ -20,30 +20,153 @@ class Config:
     # AI Services Configuration
     OPENAI_API_KEY: str = os.getenv('OPENAI_API_KEY', '')
     OPENAI_MODEL: str = os.getenv('OPENAI_MODEL', 'gpt-4')
+    OPENAI_BASE_URL: str = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+    LLM_TIMEOUT: float = float(os.getenv('LLM_TIMEOUT', '60'))
+    LLM_MAX_RETRIES: int = int(os.getenv('LLM_MAX_RETRIES', '3'))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+    LLM_TOKEN_BUDGET: int = int(os.getenv('LLM_TOKEN_BUDGET', '0'))  # tokens per hour, 0 = unlimited
+    STREAM_EDIT_INTERVAL: float = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
     HUGGINGFACE_TOKEN: str = os.getenv('HUGGINGFACE_TOKEN', '')
     
     # Heroku/Server Configuration
     HEROKU_APP_NAME: str = os.getenv('HEROKU_APP_NAME', '')
     PORT: int = int(os.getenv('PORT', '8443'))
-    WEBHOOK_URL: str = f"https://{HEROKU_APP_NAME}.herokuapp.com/" if HEROKU_APP_NAME else ''
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL') or (
+        f"https://{HEROKU_APP_NAME}.herokuapp.com/" if HEROKU_APP_NAME else ''
+    )
+    
+    # Webhook Mode
+    BOT_MODE: str = os.getenv('BOT_MODE', 'polling')  # polling | webhook
+    TELEGRAM_API_URL: str = os.getenv('TELEGRAM_API_URL', '')  # e.g. a local fake Bot API
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')  # generated when empty and WEBHOOK_URL is set
+    WEBHOOK_QUEUE_SIZE: int = int(os.getenv('WEBHOOK_QUEUE_SIZE', '256'))
+    WEBHOOK_WORKERS: int = int(os.getenv('WEBHOOK_WORKERS', '16'))
+    WEBHOOK_DRAIN_TIMEOUT: float = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '25'))
     
     # Feature Toggles
     ENABLE_VOICE: bool = os.getenv('ENABLE_VOICE', 'true').lower() == 'true'
+    VOICE_MAX_SECONDS: float = float(os.getenv('VOICE_MAX_SECONDS', '120'))
+    VOICE_SAMPLE_RATE: int = int(os.getenv('VOICE_SAMPLE_RATE', '16000'))
+    VOICE_DECODE_TIMEOUT: float = float(os.getenv('VOICE_DECODE_TIMEOUT', '30'))
+    SPEECH_BACKEND: str = os.getenv('SPEECH_BACKEND', 'google')  # google | vosk | whisper
+    VOICE_LANGUAGE: str = os.getenv('VOICE_LANGUAGE', 'en-US')
+    VOSK_MODEL_PATH: str = os.getenv('VOSK_MODEL_PATH', 'models/vosk')
+    WHISPER_MODEL: str = os.getenv('WHISPER_MODEL', 'base')
+    VOICE_WORKERS: int = int(os.getenv('VOICE_WORKERS', '4'))  # standalone VoiceProcessor only; the bot uses its inference pools
+    VOICE_MIN_SILENCE_MS: int = int(os.getenv('VOICE_MIN_SILENCE_MS', '500'))
+    VOICE_SILENCE_DB: float = float(os.getenv('VOICE_SILENCE_DB', '-40'))
+    VOICE_MAX_CHUNK_SECONDS: float = float(os.getenv('VOICE_MAX_CHUNK_SECONDS', '20'))
     ENABLE_ANALYSIS: bool = os.getenv('ENABLE_ANALYSIS', 'true').lower() == 'true'
     ENABLE_HUMANIZATION: bool = os.getenv('ENABLE_HUMANIZATION', 'true').lower() == 'true'
     
     # Rate Limiting
     REQUESTS_PER_MINUTE: int = int(os.getenv('REQUESTS_PER_MINUTE', '30'))
     MESSAGE_CHAR_LIMIT: int = int(os.getenv('MESSAGE_CHAR_LIMIT', '4000'))
+    GLOBAL_REQUESTS_PER_MINUTE: int = int(os.getenv('GLOBAL_REQUESTS_PER_MINUTE', '600'))
+    EXPENSIVE_REQUEST_COST: float = float(os.getenv('EXPENSIVE_REQUEST_COST', '3'))
+    EXPENSIVE_RESERVE: float = float(os.getenv('EXPENSIVE_RESERVE', '0.2'))
+    EXPENSIVE_QUEUE_SHARE: float = float(os.getenv('EXPENSIVE_QUEUE_SHARE', '0.5'))
+    
+    # Outbound Messages (Telegram flood limits)
+    OUTBOUND_GLOBAL_PER_SECOND: float = float(os.getenv('OUTBOUND_GLOBAL_PER_SECOND', '30'))
+    OUTBOUND_CHAT_PER_SECOND: float = float(os.getenv('OUTBOUND_CHAT_PER_SECOND', '1'))
+    OUTBOUND_CHAT_BURST: int = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+    OUTBOUND_GROUP_PER_MINUTE: float = float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv('OUTBOUND_MAX_RETRIES', '5'))
+    
+    # Inference Execution
+    MODEL_WORKERS: int = int(os.getenv('MODEL_WORKERS', '2'))
+    MODEL_QUEUE_SIZE: int = int(os.getenv('MODEL_QUEUE_SIZE', '16'))
+    NETWORK_WORKERS: int = int(os.getenv('NETWORK_WORKERS', '8'))
+    NETWORK_QUEUE_SIZE: int = int(os.getenv('NETWORK_QUEUE_SIZE', '64'))
+    BATCH_MAX_SIZE: int = int(os.getenv('BATCH_MAX_SIZE', '16'))
+    BATCH_MAX_WAIT_MS: float = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+    CONTEXT_CACHE_SIZE: int = int(os.getenv('CONTEXT_CACHE_SIZE', '256'))
+    WARMUP_MODELS: bool = os.getenv('WARMUP_MODELS', 'true').lower() == 'true'
+    DEEP_ANALYSIS_MIN_WORDS: int = int(os.getenv('DEEP_ANALYSIS_MIN_WORDS', '25'))
+    MAX_ANALYSIS_CHARS: int = int(os.getenv('MAX_ANALYSIS_CHARS', '20000'))
+    MAX_ANALYSIS_CHUNKS: int = int(os.getenv('MAX_ANALYSIS_CHUNKS', '16'))
+    PARSE_CHUNK_CHARS: int = int(os.getenv('PARSE_CHUNK_CHARS', '5000'))
+    STAGE_TIMEOUT: float = float(os.getenv('STAGE_TIMEOUT', '30'))
+    # Per-stage overrides in seconds, e.g. "insights=60,entities=20"
+    STAGE_TIMEOUTS: Dict[str, float] = {
+        stage: float(timeout) for stage, timeout in (
+            item.split('=', 1) for item in os.getenv('STAGE_TIMEOUTS', 'insights=60').split(',')
+            if '=' in item
+        )
+    }
+    
+    # Shared Model Server (empty URL = load models in-process)
+    MODEL_SERVER_URL: str = os.getenv('MODEL_SERVER_URL', '')
+    MODEL_SERVER_HOST: str = os.getenv('MODEL_SERVER_HOST', '127.0.0.1')
+    MODEL_SERVER_PORT: int = int(os.getenv('MODEL_SERVER_PORT', '8765'))
+    MODEL_SERVER_TIMEOUT: float = float(os.getenv('MODEL_SERVER_TIMEOUT', '120'))
+    
+    # Inference Backends: 'torch' (fp32), 'int8' (dynamic quantization) or 'onnx'
+    INFERENCE_BACKEND: str = os.getenv('INFERENCE_BACKEND', 'torch')
+    SENTIMENT_BACKEND: str = os.getenv('SENTIMENT_BACKEND', INFERENCE_BACKEND)
+    NER_BACKEND: str = os.getenv('NER_BACKEND', INFERENCE_BACKEND)
+    PARAPHRASE_BACKEND: str = os.getenv('PARAPHRASE_BACKEND', INFERENCE_BACKEND)
+    
+    # Humanizer
+    HUMANIZE_PLAN: str = os.getenv('HUMANIZE_PLAN', 'both')  # both | llm (one merged LLM call, faster) | t5
+    PARAPHRASE_CHUNK_TOKENS: int = int(os.getenv('PARAPHRASE_CHUNK_TOKENS', '96'))
+    PARAPHRASE_LENGTH_RATIO: float = float(os.getenv('PARAPHRASE_LENGTH_RATIO', '1.5'))
+    PARAPHRASE_NUM_BEAMS: int = int(os.getenv('PARAPHRASE_NUM_BEAMS', '3'))
+    STYLE_LENGTH_RATIO: float = float(os.getenv('STYLE_LENGTH_RATIO', '1.5'))
+    STYLE_MAX_TOKENS: int = int(os.getenv('STYLE_MAX_TOKENS', '1000'))
+    
+    # Result Cache
+    CACHE_VERSION: str = os.getenv('CACHE_VERSION', '1')
+    CACHE_MAX_BYTES: int = int(os.getenv('CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    CACHE_TTL: float = float(os.getenv('CACHE_TTL', '86400'))
+    CACHE_DIR: str = os.getenv('CACHE_DIR', '')
+    CACHE_DISK_MAX_BYTES: int = int(os.getenv('CACHE_DISK_MAX_BYTES', str(512 * 1024 * 1024)))  # per namespace
+    CACHEABLE_STYLES: list = [s for s in os.getenv('CACHEABLE_STYLES', 'professional').split(',') if s]
+    
+    # Metrics & Profiling
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '0'))  # 0 = off; keep it off the public network
+    METRICS_TOKEN: str = os.getenv('METRICS_TOKEN', '')  # bearer token for /metrics on the webhook, '' = not served
+    PROFILE_SLOW_MS: float = float(os.getenv('PROFILE_SLOW_MS', '0'))  # 0 = profiler off
+    PROFILE_INTERVAL_MS: float = float(os.getenv('PROFILE_INTERVAL_MS', '10'))
+    PROFILE_DIR: str = os.getenv('PROFILE_DIR', os.path.join(os.getenv('DATA_DIR', 'data'), 'profiles'))
     
     # Localization
     DEFAULT_LANGUAGE: str = os.getenv('DEFAULT_LANGUAGE', 'en')
     SUPPORTED_LANGUAGES: list = os.getenv('SUPPORTED_LANGUAGES', 'en,si,ta').split(',')
+    LANGUAGE_MIN_CONFIDENCE: float = float(os.getenv('LANGUAGE_MIN_CONFIDENCE', '0.6'))
+    LANGUAGE_SAMPLE_CHARS: int = int(os.getenv('LANGUAGE_SAMPLE_CHARS', '1000'))
+    TRANSLATION_BACKEND: str = os.getenv('TRANSLATION_BACKEND', 'google')
+    TRANSLATION_FALLBACK: str = os.getenv('TRANSLATION_FALLBACK', '')  # '' = fail instead
+    TRANSLATION_TIMEOUT: float = float(os.getenv('TRANSLATION_TIMEOUT', '10'))
+    TRANSLATION_BATCH_SIZE: int = int(os.getenv('TRANSLATION_BATCH_SIZE', '16'))
+    TRANSLATION_BATCH_WAIT_MS: float = float(os.getenv('TRANSLATION_BATCH_WAIT_MS', '20'))
+    TRANSLATION_BREAKER_FAILURES: int = int(os.getenv('TRANSLATION_BREAKER_FAILURES', '5'))
+    TRANSLATION_BREAKER_RESET: float = float(os.getenv('TRANSLATION_BREAKER_RESET', '30'))
     
     # Paths
     DATA_DIR: str = os.getenv('DATA_DIR', 'data')
     LOG_FILE: str = os.path.join(DATA_DIR, 'bot.log')
     MEMORY_FILE: str = os.path.join(DATA_DIR, 'memory.json')
+    MEMORY_DB: str = os.getenv('MEMORY_DB', os.path.join(DATA_DIR, 'memory.db'))
+    ONNX_CACHE_DIR: str = os.getenv('ONNX_CACHE_DIR', os.path.join(DATA_DIR, 'onnx'))
+    
+    # Conversation Memory Storage
+    MEMORY_BACKEND: str = os.getenv('MEMORY_BACKEND', 'sqlite')
+    MEMORY_FLUSH_INTERVAL: float = float(os.getenv('MEMORY_FLUSH_INTERVAL', '1.0'))
+    MEMORY_COMPACT_INTERVAL: float = float(os.getenv('MEMORY_COMPACT_INTERVAL', '3600'))
+    MEMORY_MAX_BYTES: int = int(os.getenv('MEMORY_MAX_BYTES', str(16 * 1024 * 1024)))
+    # Pre-database JSON memory file, migrated into MEMORY_DB on first start
+    MEMORY_LEGACY_FILE: str = os.getenv('MEMORY_LEGACY_FILE', 'memory.json')
+    # Per-key TTLs in seconds, e.g. "last_analysis=3600,last_message=86400"
+    MEMORY_KEY_TTLS: Dict[str, float] = {
+        key: float(ttl) for key, ttl in (
+            item.split('=', 1) for item in
+            os.getenv('MEMORY_KEY_TTLS', 'last_analysis=3600,last_message=86400').split(',')
+            if '=' in item
+        )
+    }
     
     @classmethod
     def validate(cls) -> bool:
@@ -78,8 +201,17 @@ class Config:
             },
             'limits': {
                 'requests_per_minute': cls.REQUESTS_PER_MINUTE,
+                'global_requests_per_minute': cls.GLOBAL_REQUESTS_PER_MINUTE,
                 'message_length': cls.MESSAGE_CHAR_LIMIT
             },
+            'inference': {
+                'model_workers': cls.MODEL_WORKERS,
+                'model_queue_size': cls.MODEL_QUEUE_SIZE,
+                'network_workers': cls.NETWORK_WORKERS,
+                'network_queue_size': cls.NETWORK_QUEUE_SIZE,
+                'batch_max_size': cls.BATCH_MAX_SIZE,
+                'batch_max_wait_ms': cls.BATCH_MAX_WAIT_MS
+            },
             'localization': {
                 'default_language': cls.DEFAULT_LANGUAGE,
                 'supported_languages': cls.SUPPORTED_LANGUAGES
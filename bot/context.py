@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from bot.chunking import clip_text
+
+
+class AnalysisContext:
+    """
+    Per-message state shared by every analysis stage.
+
+    Holds the text, its spaCy Doc (parsed at most once, on first use) and the
+    results of stages that already ran, so quick analysis, /analyze and the
+    feature extractors never redo each other's work for the same message.
+    Text beyond `max_chars` is cut off (at a sentence boundary) to bound the
+    work done per request.
+    """
+
+    def __init__(self, text: str, parse: Callable[[str], Any], max_chars: int = 0):
+        self.text = clip_text(text, max_chars) if max_chars else text
+        self.truncated = len(self.text) < len(text)
+        self._parse = parse
+        self._doc = None
+        self._doc_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.results: Dict[str, Any] = {}
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            with self._doc_lock:
+                if self._doc is None:
+                    self._doc = self._parse(self.text)
+        return self._doc
+
+    @property
+    def parsed(self) -> bool:
+        return self._doc is not None
+
+    def set_doc(self, doc):
+        """Use a Doc parsed elsewhere (e.g. in a batch) unless one already exists"""
+        with self._doc_lock:
+            if self._doc is None:
+                self._doc = doc
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached result for `key`, computing it once if missing.
+        Each key has its own lock, so different stages can compute concurrently."""
+        if key in self.results:
+            return self.results[key]
+        with self._lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self.results:
+                self.results[key] = compute()
+            return self.results[key]
+
+
+class ContextCache:
+    """Small LRU of AnalysisContext objects keyed by message text"""
+
+    def __init__(self, parse: Callable[[str], Any], max_size: int = 256, max_chars: int = 0):
+        self.parse = parse
+        self.max_size = max_size
+        self.max_chars = max_chars
+        self._contexts: "OrderedDict[str, AnalysisContext]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> AnalysisContext:
+        with self._lock:
+            context = self._contexts.get(text)
+            if context is not None:
+                self._contexts.move_to_end(text)
+                return context
+            context = AnalysisContext(text, self.parse, self.max_chars)
+            self._contexts[text] = context
+            while len(self._contexts) > self.max_size:
+                self._contexts.popitem(last=False)
+            return context
+
+    def peek(self, text: str) -> Optional[AnalysisContext]:
+        with self._lock:
+            return self._contexts.get(text)
+
+    def __len__(self) -> int:
+        return len(self._contexts)
@@ -0,0 +1,129 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from bot.config import Config
+from bot.metrics import profiler
+from bot.ratelimit import CHEAP, EXPENSIVE
+
+
+class QueueFullError(RuntimeError):
+    """Raised when an inference pool cannot accept more work"""
+
+    def __init__(self, kind: str):
+        super().__init__(f"Inference pool '{kind}' is full")
+        self.kind = kind
+
+
+class BoundedPool:
+    """
+    A thread pool with a hard cap on queued + running jobs.
+
+    Expensive jobs may only fill `expensive_share` of the queue; the rest is
+    kept for cheap jobs so quick replies still get through under load.
+    """
+
+    def __init__(self, kind: str, workers: int, queue_size: int, expensive_share: float = 1.0):
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.expensive_limit = workers + int(queue_size * expensive_share)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"{kind}-inference"
+        )
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def acquire(self, priority: str = CHEAP):
+        limit = self.expensive_limit if priority == EXPENSIVE else self.workers + self.queue_size
+        with self._lock:
+            if self.pending >= limit:
+                self.rejected += 1
+                raise QueueFullError(self.kind)
+            self.pending += 1
+
+    def release(self, future):
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def submit(self, func: Callable[[], Any], priority: str = CHEAP) -> Future:
+        """Queue func, or raise QueueFullError straight away when the pool is saturated"""
+        self.acquire(priority)
+        try:
+            future = self.executor.submit(self.call, profiler.traced(func))
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.running += 1
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': self.running,
+                'queued': self.pending - self.running,
+                'capacity': self.workers + self.queue_size,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected
+            }
+
+
+class InferenceExecutor:
+    """
+    Runs blocking model and network calls off the event loop.
+
+    Work is split by kind so slow OpenAI/Google round trips cannot starve
+    the CPU-bound transformer calls (and vice versa):
+        'model'   - local transformers / spaCy inference
+        'network' - calls that mostly wait on a remote API
+    """
+
+    def __init__(self):
+        self.pools = {
+            'model': BoundedPool('model', Config.MODEL_WORKERS, Config.MODEL_QUEUE_SIZE,
+                                 Config.EXPENSIVE_QUEUE_SHARE),
+            'network': BoundedPool('network', Config.NETWORK_WORKERS, Config.NETWORK_QUEUE_SIZE,
+                                   Config.EXPENSIVE_QUEUE_SHARE)
+        }
+
+    async def run(self, kind: str, func: Callable[..., Any], *args,
+                  priority: str = CHEAP, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool for `kind` and await the result.
+
+        Raises QueueFullError straight away when the pool is saturated (for
+        the given priority) so the caller can answer with a backpressure
+        reply instead of waiting.
+        """
+        future = self.pools[kind].submit(functools.partial(func, *args, **kwargs), priority)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Queue depth and throughput counters for every pool"""
+        return {kind: pool.stats() for kind, pool in self.pools.items()}
+
+    def shutdown(self, wait: bool = True):
+        for pool in self.pools.values():
+            pool.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,89 @@
+"""
+Vectorized linguistic features for deception scoring and writing patterns.
+
+Every feature comes from one `Doc.to_array` call per document instead of
+a separate Python loop over the tokens for each count, and many documents
+can be stacked into one matrix for a single `deception_model.predict`.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# Columns of the feature matrix. The first six are the deception model inputs.
+FEATURES = (
+    'chars', 'words', 'sentences', 'punctuation', 'first_person', 'first_person_plural',
+    'tokens', 'unique_tokens', 'nouns', 'verbs', 'adjectives'
+)
+DECEPTION_FEATURES = FEATURES[:6]
+_COLUMN = {name: i for i, name in enumerate(FEATURES)}
+
+FIRST_PERSON = ('i', 'me', 'my')
+FIRST_PERSON_PLURAL = ('we', 'us', 'our')
+
+
+def _string_ids(vocab, words: Sequence[str]) -> np.ndarray:
+    return np.array([vocab.strings.add(word) for word in words], dtype=np.uint64)
+
+
+def doc_features(text: str, doc) -> np.ndarray:
+    """All features of one parsed text as a row of the feature matrix"""
+    from spacy.attrs import IS_PUNCT, LEMMA, ORTH, POS, SENT_START
+    from spacy.symbols import ADJ, NOUN, VERB
+
+    row = np.zeros(len(FEATURES), dtype=np.float64)
+    row[_COLUMN['chars']] = len(text)
+    row[_COLUMN['words']] = len(text.split())
+    if not len(doc):
+        return row
+
+    orth, lemma, pos, punct, sent_start = doc.to_array([ORTH, LEMMA, POS, IS_PUNCT, SENT_START]).T
+    pos_counts = np.bincount(pos.astype(np.int64), minlength=max(NOUN, VERB, ADJ) + 1)
+    row[_COLUMN['sentences']] = max(1, np.count_nonzero(sent_start == 1))
+    row[_COLUMN['punctuation']] = np.count_nonzero(punct)
+    row[_COLUMN['first_person']] = np.count_nonzero(np.isin(lemma, _string_ids(doc.vocab, FIRST_PERSON)))
+    row[_COLUMN['first_person_plural']] = np.count_nonzero(
+        np.isin(lemma, _string_ids(doc.vocab, FIRST_PERSON_PLURAL))
+    )
+    row[_COLUMN['tokens']] = len(doc)
+    row[_COLUMN['unique_tokens']] = np.unique(orth).size
+    row[_COLUMN['nouns']] = pos_counts[NOUN]
+    row[_COLUMN['verbs']] = pos_counts[VERB]
+    row[_COLUMN['adjectives']] = pos_counts[ADJ]
+    return row
+
+
+def feature_matrix(texts: Sequence[str], docs: Sequence) -> np.ndarray:
+    """Stack the features of many parsed texts, one row per text"""
+    if not texts:
+        return np.zeros((0, len(FEATURES)), dtype=np.float64)
+    return np.vstack([doc_features(text, doc) for text, doc in zip(texts, docs)])
+
+
+def deception_inputs(matrix: np.ndarray) -> np.ndarray:
+    """The columns of a feature matrix the deception model was built on"""
+    return matrix[:, :len(DECEPTION_FEATURES)]
+
+
+def writing_patterns(row: np.ndarray) -> Dict[str, object]:
+    """Writing-style summary from one row of the feature matrix"""
+    tokens = row[_COLUMN['tokens']]
+    if not tokens:
+        return {
+            'avg_sentence_length': 0.0,
+            'word_diversity': 0.0,
+            'pos_ratios': {'nouns': 0.0, 'verbs': 0.0, 'adjectives': 0.0}
+        }
+    return {
+        # Sentences partition the doc, so their mean length is tokens / sentences
+        'avg_sentence_length': float(tokens / row[_COLUMN['sentences']]),
+        'word_diversity': float(row[_COLUMN['unique_tokens']] / tokens),
+        'pos_ratios': {
+            'nouns': float(row[_COLUMN['nouns']] / tokens),
+            'verbs': float(row[_COLUMN['verbs']] / tokens),
+            'adjectives': float(row[_COLUMN['adjectives']] / tokens)
+        }
+    }
+
+
+def writing_patterns_batch(matrix: np.ndarray) -> List[Dict[str, object]]:
+    return [writing_patterns(row) for row in matrix]
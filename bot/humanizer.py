@@ -1,21 +1,66 @@
-import os
 import random
-from typing import List, Dict
-from transformers import pipeline
-import openai
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import nltk
 from nltk.tokenize import sent_tokenize
+from bot.batching import MicroBatcher
+from bot.cache import ResultCache
+from bot.chunking import iter_chunks, token_counter
+from bot.config import Config
+from bot.backends import load_pipeline
+from bot.lazy import lazy_property, timed
+from bot.llm import get_client
+from bot.metrics import STAGE_LATENCY
 
-nltk.download('punkt')
+PARAPHRASE_MODEL = "t5-base"
+STYLE_MODEL = "gpt-3.5-turbo"
+
+# Humanization plans: which generation passes run before the final touches
+#   llm  - one LLM rewrite that also restructures sentences (no T5 pass)
+#   t5   - local T5 paraphrase only (no API cost)
+#   both - T5 paraphrase, then the LLM style rewrite
+HUMANIZE_PLANS = ('llm', 't5', 'both')
+
+# Appended to the style prompt when the LLM rewrite replaces the T5 pass
+MERGED_PARAPHRASE_PROMPT = (
+    " Also vary the sentence structure and word choice so it doesn't "
+    "read like a copy of the original."
+)
+
+# style -> (system prompt, temperature)
+STYLE_PROMPTS = {
+    'casual': (
+        "Rewrite this text to sound like casual spoken conversation. "
+        "Use contractions, informal language, and conversational tone. "
+        "Keep the meaning identical but make it sound natural.",
+        0.8
+    ),
+    'professional': (
+        "Rewrite this text to sound professional yet natural. "
+        "Avoid jargon but maintain formal tone. Use complete sentences "
+        "but don't sound robotic. Keep the meaning identical.",
+        0.6
+    ),
+    'friendly': (
+        "Rewrite this text to sound warm and friendly. "
+        "Use positive language and inclusive phrasing. "
+        "Imagine you're talking to a colleague you like. "
+        "Keep the meaning identical.",
+        0.7
+    ),
+}
+
+def _ensure_punkt():
+    """Download the punkt tokenizer only if it is not installed yet"""
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        with timed('nltk punkt download'):
+            nltk.download('punkt', quiet=True)
 
 class Humanizer:
     def __init__(self):
-        self.paraphraser = pipeline(
-            "text2text-generation",
-            model="t5-base",
-            device=-1
-        )
-        openai.api_key = os.getenv('OPENAI_API_KEY')
+        self.llm = get_client()
         self.filler_words = [
             'like', 'you know', 'I mean', 'well', 'actually',
             'basically', 'sort of', 'kind of', 'right', 'okay'
@@ -24,114 +69,156 @@ class Humanizer:
             'So', 'Anyway', 'Now', 'Then', 'Well',
             'Look', 'See', 'I think', 'I believe'
         ]
+        self.style_cache = ResultCache('style', version=STYLE_MODEL)
+        self.paraphrase_cache = ResultCache(
+            'paraphrase', version=f"{PARAPHRASE_MODEL}:{Config.PARAPHRASE_BACKEND}"
+        )
+        self.paraphrase_batcher = MicroBatcher(
+            self._paraphrase_batch, Config.BATCH_MAX_SIZE, Config.BATCH_MAX_WAIT_MS, 'paraphrase'
+        )
+        self._punkt_ready = False
 
-    def humanize(self, text: str, style: str = 'casual') -> str:
+    @lazy_property
+    def paraphraser(self):
+        return load_pipeline(
+            "text2text-generation", PARAPHRASE_MODEL, Config.PARAPHRASE_BACKEND, device=-1
+        )
+
+    def warm_up(self):
+        """Load the paraphrase model and tokenizer data now"""
+        self._sentences('Warm up.')
+        self.paraphraser
+
+    def _sentences(self, text: str) -> List[str]:
+        if not self._punkt_ready:
+            _ensure_punkt()
+            self._punkt_ready = True
+        return sent_tokenize(text)
+
+    def plan(self, plan: Optional[str] = None) -> str:
+        """The humanization plan to use (Config.HUMANIZE_PLAN by default)"""
+        plan = plan or Config.HUMANIZE_PLAN
+        if plan not in HUMANIZE_PLANS:
+            raise ValueError(f"Unknown humanize plan '{plan}', expected one of {HUMANIZE_PLANS}")
+        return plan
+
+    def humanize(self, text: str, style: str = 'casual', plan: Optional[str] = None) -> str:
         """
         Transform text to sound more natural
         Styles: 'casual', 'professional', 'friendly'
+        Plans: 'llm', 't5', 'both' (see HUMANIZE_PLANS)
         """
+        plan = self.plan(plan)
+        
         # First pass - paraphrasing
-        paraphrased = self._paraphrase(text)
+        if plan in ('t5', 'both'):
+            text = self.paraphrase(text)
         
         # Second pass - style adaptation
-        styled = self._adapt_style(paraphrased, style)
+        if plan in ('llm', 'both'):
+            text = self._adapt_style(text, style, merged=plan == 'llm')
         
         # Third pass - add natural features
-        humanized = self._add_natural_features(styled, style)
-        
-        return humanized
+        return self._add_natural_features(text, style)
+
+    def paraphrase(self, text: str) -> str:
+        """Initial paraphrasing to break rigid structures.
+        Text is paraphrased in sentence-sized chunks, generated in batches
+        and cached chunk by chunk."""
+        with STAGE_LATENCY.time(component='humanizer', stage='paraphrase'):
+            return self._paraphrase(text)
 
     def _paraphrase(self, text: str) -> str:
-        """Initial paraphrasing to break rigid structures"""
-        result = self.paraphraser(
-            f"paraphrase: {text}",
-            max_length=len(text) + 100,
+        chunks = list(iter_chunks(
+            text, token_counter(self.paraphraser.tokenizer), Config.PARAPHRASE_CHUNK_TOKENS
+        )) or [text]
+        keys = [self.paraphrase_cache.key(chunk) for chunk in chunks]
+        results = [self.paraphrase_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            generated = self.paraphrase_batcher.map([chunks[i] for i in missing])
+            for i, paraphrased in zip(missing, generated):
+                results[i] = paraphrased
+                self.paraphrase_cache.set(keys[i], paraphrased)
+        return ' '.join(results)
+
+    def _paraphrase_batch(self, chunks: List[str]) -> List[str]:
+        # Length budget in tokens, from the longest chunk in the batch
+        longest = max(len(self.paraphraser.tokenizer.tokenize(chunk)) for chunk in chunks)
+        results = self.paraphraser(
+            [f"paraphrase: {chunk}" for chunk in chunks],
+            batch_size=len(chunks),
+            max_new_tokens=int(longest * Config.PARAPHRASE_LENGTH_RATIO) + 8,
             do_sample=True,
             temperature=0.7,
-            num_beams=3
+            num_beams=Config.PARAPHRASE_NUM_BEAMS
         )
-        return result[0]['generated_text']
+        return [result['generated_text'] for result in results]
 
-    def _adapt_style(self, text: str, style: str) -> str:
+    def _adapt_style(self, text: str, style: str, merged: bool = False) -> str:
         """Adapt text to specific communication style"""
-        if style == 'professional':
-            return self._make_professional(text)
-        elif style == 'friendly':
-            return self._make_friendly(text)
-        else:  # casual
-            return self._make_casual(text)
-
-    def _make_casual(self, text: str) -> str:
-        """Make text sound casual and conversational"""
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{
-                "role": "system",
-                "content": (
-                    "Rewrite this text to sound like casual spoken conversation. "
-                    "Use contractions, informal language, and conversational tone. "
-                    "Keep the meaning identical but make it sound natural."
-                )
-            }, {
-                "role": "user",
-                "content": text
-            }],
-            temperature=0.8,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
-
-    def _make_professional(self, text: str) -> str:
-        """Make text sound professional but not robotic"""
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{
-                "role": "system",
-                "content": (
-                    "Rewrite this text to sound professional yet natural. "
-                    "Avoid jargon but maintain formal tone. Use complete sentences "
-                    "but don't sound robotic. Keep the meaning identical."
-                )
-            }, {
-                "role": "user",
-                "content": text
-            }],
-            temperature=0.6,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
-
-    def _make_friendly(self, text: str) -> str:
-        """Make text sound warm and friendly"""
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{
-                "role": "system",
-                "content": (
-                    "Rewrite this text to sound warm and friendly. "
-                    "Use positive language and inclusive phrasing. "
-                    "Imagine you're talking to a colleague you like. "
-                    "Keep the meaning identical."
-                )
-            }, {
-                "role": "user",
-                "content": text
-            }],
-            temperature=0.7,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
+        if style in Config.CACHEABLE_STYLES:
+            return self.style_cache.get_or_compute(
+                text, lambda: self._rewrite(text, style, merged), style, merged
+            )
+        return self._rewrite(text, style, merged)
+
+    def _rewrite(self, text: str, style: str, merged: bool = False) -> str:
+        messages, temperature = self._style_request(text, style, merged)
+        with STAGE_LATENCY.time(component='humanizer', stage='style'):
+            return self.llm.chat_sync(messages, STYLE_MODEL, temperature, max_tokens=self._style_budget(text))
+
+    def _style_budget(self, text: str) -> int:
+        """Completion token budget for rewriting `text` (~4 characters per token)"""
+        return min(Config.STYLE_MAX_TOKENS, int(len(text) / 4 * Config.STYLE_LENGTH_RATIO) + 64)
+
+    async def stream_style(self, text: str, style: str = 'casual', plan: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield the style rewrite as it is generated (cumulative text so far)"""
+        merged = self.plan(plan) == 'llm'
+        cacheable = style in Config.CACHEABLE_STYLES
+        key = self.style_cache.key(text, style, merged)
+        if cacheable:
+            cached = self.style_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        messages, temperature = self._style_request(text, style, merged)
+        styled = ''
+        started = time.perf_counter()
+        async for delta in self.llm.stream(messages, STYLE_MODEL, temperature, self._style_budget(text)):
+            styled += delta
+            yield styled
+        STAGE_LATENCY.observe(time.perf_counter() - started, component='humanizer', stage='style_stream')
+        if cacheable and styled:
+            self.style_cache.set(key, styled)
+
+    def finish(self, text: str, style: str = 'casual') -> str:
+        """Final pass applied to streamed style output"""
+        return self._add_natural_features(text, style)
+
+    def _style_request(self, text: str, style: str,
+                       merged: bool = False) -> Tuple[List[Dict[str, str]], float]:
+        """Chat messages and temperature for a style rewrite (unknown styles fall back to casual)"""
+        prompt, temperature = STYLE_PROMPTS.get(style, STYLE_PROMPTS['casual'])
+        if merged:
+            prompt += MERGED_PARAPHRASE_PROMPT
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": text}
+        ]
+        return messages, temperature
 
     def _add_natural_features(self, text: str, style: str) -> str:
         """Add natural speech characteristics"""
-        sentences = sent_tokenize(text)
+        sentences = self._sentences(text)
         
         # Add discourse markers
         if random.random() < 0.4 and len(sentences) > 1:
             sentences[0] = f"{random.choice(self.discourse_markers)}, {sentences[0].lower()}"
         
         # Add fillers for casual style
-        if style == 'casual' and random.random() < 0.3:
+        if style == 'casual' and random.random() < 0.3 and len(sentences) > 1:
             pos = random.randint(1, len(sentences)-1)
             sentences.insert(pos, random.choice(self.filler_words).capitalize())
         
@@ -1,9 +1,88 @@
-from googletrans import Translator
+import logging
+import re
 from typing import Tuple, Optional
+from bot.cache import ResultCache
+from bot.config import Config
+from bot.lazy import lazy_property
+
+logger = logging.getLogger(__name__)
+
+# Scripts used by exactly one supported language: no classifier needed
+SCRIPT_LANGUAGES = [
+    ('si', re.compile(r'[\u0d80-\u0dff]')),
+    ('ta', re.compile(r'[\u0b80-\u0bff]')),
+    ('ko', re.compile(r'[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]')),
+    ('ja', re.compile(r'[\u3040-\u30ff]')),
+    ('zh-cn', re.compile(r'[\u4e00-\u9fff]')),
+    ('ru', re.compile(r'[\u0400-\u04ff]')),
+]
+_LETTER = re.compile(r'[^\W\d_]')
+
+
+class LanguageDetector:
+    """
+    Offline language identification.
+
+    Sinhala, Tamil and the CJK/Cyrillic languages are recognised from their
+    script alone; everything else goes to langdetect's character n-gram
+    classifier. Guesses below `min_confidence`, and texts with too few
+    letters for n-gram statistics to mean anything, are reported as unknown.
+    """
+
+    def __init__(self, min_confidence: float = 0.6, sample_chars: int = 1000, min_letters: int = 8):
+        self.min_confidence = min_confidence
+        self.sample_chars = sample_chars
+        self.min_letters = min_letters
+
+    @lazy_property
+    def factory(self):
+        from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+        factory = DetectorFactory()
+        factory.load_profile(PROFILES_DIRECTORY)
+        factory.set_seed(0)  # deterministic answers for the same text
+        return factory
+
+    def detect(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (language code, confidence), or (None, confidence) if unsure"""
+        sample = text[:self.sample_chars]
+        letters = len(_LETTER.findall(sample))
+        if not letters:
+            return None, 0.0
+
+        code, confidence = self._detect_script(sample, letters)
+        if code is None:
+            if letters < self.min_letters:
+                return None, 0.0
+            code, confidence = self._classify(sample)
+        if confidence < self.min_confidence:
+            return None, confidence
+        return code, confidence
+
+    def _detect_script(self, sample: str, letters: int) -> Tuple[Optional[str], float]:
+        counts = {code: len(pattern.findall(sample)) for code, pattern in SCRIPT_LANGUAGES}
+        if counts['ja']:
+            # Japanese mixes kana with Han characters
+            counts['ja'] += counts.pop('zh-cn')
+        code = max(counts, key=counts.get)
+        # Vowel signs of Indic scripts are marks, not letters, so count them in
+        share = counts[code] / max(letters, sum(counts.values()))
+        if share >= 0.5:
+            return code, share
+        return None, 0.0
+
+    def _classify(self, sample: str) -> Tuple[Optional[str], float]:
+        from langdetect.lang_detect_exception import LangDetectException
+        detector = self.factory.create()
+        detector.append(sample)
+        try:
+            best = detector.get_probabilities()[0]
+        except (LangDetectException, IndexError):
+            return None, 0.0
+        return best.lang, best.prob
+
 
 class LanguageProcessor:
     def __init__(self):
-        self.translator = Translator()
         self.language_names = {
             'en': 'English',
             'si': 'Sinhala',
@@ -17,20 +96,41 @@ class LanguageProcessor:
             'ja': 'Japanese',
             'ko': 'Korean'
         }
+        self.detector = LanguageDetector(Config.LANGUAGE_MIN_CONFIDENCE, Config.LANGUAGE_SAMPLE_CHARS)
+        self.detect_cache = ResultCache('detect', version='langdetect')
+
+    def warm_up(self):
+        """Load the n-gram profiles now instead of on the first /language"""
+        self.detector.factory
+
+    @lazy_property
+    def translation(self):
+        """Network translation service, only needed for actual translation"""
+        from bot.translation import create_service
+        return create_service()
 
     def detect(self, text: str) -> str:
         """Detect language and return its name"""
-        try:
-            detected = self.translator.detect(text)
-            return self.language_names.get(detected.lang, detected.lang)
-        except:
+        lang = self.detect_code(text)
+        if lang is None:
             return "Unknown"
+        return self.language_names.get(lang, lang)
 
-    def translate(self, text: str, target: str = 'en') -> Tuple[Optional[str], Optional[str]]:
-        """Translate text to target language"""
+    def detect_code(self, text: str) -> Optional[str]:
+        """Detect language locally and return its code (None when unsure)"""
         try:
-            result = self.translator.translate(text, dest=target)
-            return result.text, self.language_names.get(result.src, result.src)
+            lang, _ = self.detect_cache.get_or_compute(text, lambda: self.detector.detect(text))
+            return lang
         except Exception as e:
-            print(f"Translation error: {e}")
+            logger.error(f"Language detection error: {e}")
+            return None
+
+    async def translate(self, text: str, target: str = 'en') -> Tuple[Optional[str], Optional[str]]:
+        """Translate text to target language"""
+        from bot.translation import TranslationError
+        try:
+            translated, src = await self.translation.translate(text, target)
+            return translated, self.language_names.get(src, src)
+        except TranslationError as e:
+            logger.warning(f"Translation error: {e}")
             return None, None
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+
+# component name -> seconds spent loading it, in load order
+load_times: "OrderedDict[str, float]" = OrderedDict()
+_process_start = time.perf_counter()
+
+
+@contextmanager
+def timed(component: str):
+    """Record how long a component took to load"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        load_times[component] = load_times.get(component, 0.0) + time.perf_counter() - start
+
+
+class lazy_property:
+    """
+    Attribute that is built on first access and then cached on the instance.
+
+    Used for heavy models so importing the package and constructing the
+    bot's components is instant; each load is timed into `load_times`.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.label = func.__name__
+        self.lock = threading.Lock()
+        self.__doc__ = func.__doc__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.label = f"{owner.__name__}.{name}"
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with self.lock:
+            if self.name not in obj.__dict__:
+                with timed(self.label):
+                    obj.__dict__[self.name] = self.func(obj)
+        return obj.__dict__[self.name]
+
+
+def is_loaded(obj, name: str) -> bool:
+    return name in obj.__dict__
+
+
+def startup_report() -> str:
+    """Human-readable breakdown of where startup time went"""
+    lines = [f"Startup report ({time.perf_counter() - _process_start:.1f}s since import):"]
+    for component, seconds in sorted(load_times.items(), key=lambda item: -item[1]):
+        lines.append(f"  {component:<32} {seconds:7.2f}s")
+    lines.append(f"  {'total load time':<32} {sum(load_times.values()):7.2f}s")
+    return '\n'.join(lines)
+
+
+def startup_stats() -> Dict[str, float]:
+    return {component: round(seconds, 3) for component, seconds in load_times.items()}
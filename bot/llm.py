@@ -0,0 +1,272 @@
+"""
+Async OpenAI chat client shared by AIDetective and Humanizer.
+
+All requests run on one private event loop thread with one pooled httpx
+session, so sync callers (model threads) and async callers (handlers) share
+the same connection pool, in-flight cap and token accounting. Point
+OPENAI_BASE_URL at a local fake server to test without the real API.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from bot.config import Config
+
+_DONE = object()
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(RuntimeError):
+    """Raised when a chat completion fails after all retries"""
+
+
+class TokenBudgetExceeded(LLMError):
+    """Raised when the rolling hourly token budget is used up"""
+
+
+class LLMClient:
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, token_budget: Optional[int] = None):
+        self.api_key = api_key if api_key is not None else Config.OPENAI_API_KEY
+        self.base_url = (base_url or Config.OPENAI_BASE_URL).rstrip('/')
+        self.timeout = timeout or Config.LLM_TIMEOUT
+        self.max_retries = Config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.token_budget = Config.LLM_TOKEN_BUDGET if token_budget is None else token_budget
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._recent_tokens: deque = deque()  # (timestamp, tokens) within the last hour
+        self.in_flight = 0
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.retries = 0
+        self.tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {'prompt': 0, 'completion': 0})
+
+    async def chat(self, messages: List[Dict[str, str]], model: str,
+                   temperature: float = 0.7, max_tokens: int = 500) -> str:
+        """Complete a chat from any event loop"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, model, temperature, max_tokens), self._get_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def chat_sync(self, messages: List[Dict[str, str]], model: str,
+                  temperature: float = 0.7, max_tokens: int = 500) -> str:
+        """Complete a chat from a worker thread (never from the client's own loop)"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, model, temperature, max_tokens), self._get_loop()
+        )
+        return future.result()
+
+    async def stream(self, messages: List[Dict[str, str]], model: str,
+                     temperature: float = 0.7, max_tokens: int = 500) -> AsyncIterator[str]:
+        """Yield content deltas as the completion is generated"""
+        caller_loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def put(item):
+            caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        async def produce():
+            try:
+                async for delta in self._stream(messages, model, temperature, max_tokens):
+                    put(delta)
+            except Exception as e:
+                put(e)
+            finally:
+                put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), self._get_loop())
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'in_flight': self.in_flight,
+                'calls': dict(self.calls),
+                'errors': dict(self.errors),
+                'retries': self.retries,
+                'tokens': {model: dict(counts) for model, counts in self.tokens.items()},
+                'tokens_last_hour': self._tokens_last_hour(),
+                'token_budget': self.token_budget
+            }
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._session.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                ready = threading.Event()
+                thread = threading.Thread(target=self._run_loop, args=(ready,), name='llm-client', daemon=True)
+                thread.start()
+                ready.wait()
+        return self._loop
+
+    def _run_loop(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._session = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            ),
+            headers={'Authorization': f'Bearer {self.api_key}'}
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop = loop
+        ready.set()
+        loop.run_forever()
+
+    async def _complete(self, messages, model, temperature, max_tokens) -> str:
+        payload = {'model': model, 'messages': messages,
+                   'temperature': temperature, 'max_tokens': max_tokens}
+        async with self._slot(model, max_tokens):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self._session.post('/chat/completions', json=payload)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    await self._backoff(attempt, model, e)
+                    continue
+                if response.status_code in _RETRY_STATUSES:
+                    await self._backoff(attempt, model, LLMError(f"HTTP {response.status_code}"), response)
+                    continue
+                if response.status_code != 200:
+                    self._count_error(model)
+                    raise LLMError(f"OpenAI request failed: HTTP {response.status_code} {response.text[:200]}")
+                data = response.json()
+                usage = data.get('usage', {})
+                self._record_tokens(model, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+                return data['choices'][0]['message']['content']
+
+    async def _stream(self, messages, model, temperature, max_tokens) -> AsyncIterator[str]:
+        payload = {'model': model, 'messages': messages, 'temperature': temperature,
+                   'max_tokens': max_tokens, 'stream': True}
+        async with self._slot(model, max_tokens):
+            for attempt in range(self.max_retries + 1):
+                produced = []
+                try:
+                    async with self._session.stream('POST', '/chat/completions', json=payload) as response:
+                        if response.status_code in _RETRY_STATUSES:
+                            await self._backoff(attempt, model, LLMError(f"HTTP {response.status_code}"), response)
+                            continue
+                        if response.status_code != 200:
+                            self._count_error(model)
+                            body = (await response.aread()).decode('utf-8', 'replace')
+                            raise LLMError(f"OpenAI request failed: HTTP {response.status_code} {body[:200]}")
+                        async for line in response.aiter_lines():
+                            if not line.startswith('data:'):
+                                continue
+                            data = line[5:].strip()
+                            if data == '[DONE]':
+                                break
+                            choices = json.loads(data).get('choices') or [{}]
+                            delta = choices[0].get('delta', {}).get('content')
+                            if delta:
+                                produced.append(delta)
+                                yield delta
+                    # Streamed responses carry no usage block; estimate ~4 chars per token
+                    prompt_chars = sum(len(m['content']) for m in messages)
+                    self._record_tokens(model, prompt_chars // 4, len(''.join(produced)) // 4)
+                    return
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    if produced:
+                        # Can't transparently retry once the user has seen partial output
+                        self._count_error(model)
+                        raise LLMError(f"OpenAI stream interrupted: {e}") from e
+                    await self._backoff(attempt, model, e)
+
+    @asynccontextmanager
+    async def _slot(self, model: str, max_tokens: int):
+        """Budget check plus a place under the global in-flight cap"""
+        self._check_budget(max_tokens)
+        async with self._semaphore:
+            with self._stats_lock:
+                self.in_flight += 1
+                self.calls[model] += 1
+            try:
+                yield
+            finally:
+                with self._stats_lock:
+                    self.in_flight -= 1
+
+    async def _backoff(self, attempt: int, model: str, error: Exception,
+                       response: Optional[httpx.Response] = None):
+        if attempt >= self.max_retries:
+            self._count_error(model)
+            raise LLMError(f"OpenAI request failed after {attempt + 1} attempts: {error}") from error
+        with self._stats_lock:
+            self.retries += 1
+        delay = min(2 ** attempt, 30) * (0.5 + random.random())
+        if response is not None and response.headers.get('retry-after', '').isdigit():
+            delay = max(delay, float(response.headers['retry-after']))
+        await asyncio.sleep(delay)
+
+    def _count_error(self, model: str):
+        with self._stats_lock:
+            self.errors[model] += 1
+
+    def _record_tokens(self, model: str, prompt: int, completion: int):
+        with self._stats_lock:
+            self.tokens[model]['prompt'] += prompt
+            self.tokens[model]['completion'] += completion
+            self._recent_tokens.append((time.time(), prompt + completion))
+
+    def _tokens_last_hour(self) -> int:
+        cutoff = time.time() - 3600
+        while self._recent_tokens and self._recent_tokens[0][0] < cutoff:
+            self._recent_tokens.popleft()
+        return sum(tokens for _, tokens in self._recent_tokens)
+
+    def _check_budget(self, max_tokens: int):
+        if not self.token_budget:
+            return
+        with self._stats_lock:
+            used = self._tokens_last_hour()
+        if used + max_tokens > self.token_budget:
+            raise TokenBudgetExceeded(
+                f"Hourly token budget exhausted ({used}/{self.token_budget} tokens used)"
+            )
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Process-wide client so every component shares one pool and budget"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
@@ -0,0 +1,368 @@
+"""
+Offline load test: replays synthetic Telegram traffic through the real handlers.
+
+The handlers registered by `bot.main.build_application` process generated
+`Update`s (plain text, commands, voice notes) while every network
+dependency is replaced by a local fake with configurable latency:
+
+- the Telegram Bot API, through the application's `request` hook
+- OpenAI, as a local HTTP server that OPENAI_BASE_URL points at
+- googletrans, as a translation backend that sleeps and echoes
+- the speech recognizer, as a backend that sleeps and returns words
+
+The models themselves (spaCy, the transformers pipelines, the deception
+model, T5) and ConversationMemory are real, so regressions in AIDetective,
+Humanizer or ConversationMemory show up in the numbers. Run it through
+the benchmark CLI:
+
+    python -m bot.benchmark load --scenarios text,analyze,humanize,voice --updates 200 --rate 20
+"""
+import asyncio
+import io
+import json
+import math
+import random
+import statistics
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+from bot.translation import TranslationBackend
+from bot.voice import RecognizerBackend
+
+BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': 'AI Detective', 'username': 'ai_detective_bot'}
+
+# Commands each scenario sends; 'text' is a plain (non-command) message
+SCENARIOS = {
+    'text': [('text', 1)],
+    'analyze': [('analyze', 1)],
+    'deep': [('deep', 1)],
+    'humanize': [('humanize', 1)],
+    'language': [('language', 1)],
+    'translate': [('translate', 1)],
+    'voice': [('voice', 1)],
+    'mixed': [('text', 10), ('analyze', 4), ('deep', 1), ('humanize', 2),
+              ('language', 2), ('translate', 2), ('voice', 1)],
+}
+
+INSIGHT_WORDS = (
+    "The writer sounds confident but leans on absolute claims, which often signals "
+    "rehearsed statements. Entities are specific and consistent, the tone is mostly "
+    "neutral, and nothing in the structure strongly suggests deception."
+).split()
+
+
+class FakeBotAPI(BaseRequest):
+    """
+    Stand-in for the HTTP layer to the Telegram Bot API.
+
+    Answers the methods the handlers call (getMe, sendMessage,
+    editMessageText, getFile and file downloads) after `latency_ms`, and
+    records what was sent so replies can be classified.
+    """
+
+    def __init__(self, latency_ms: float = 30.0):
+        self.latency = latency_ms / 1000.0
+        self.files: Dict[str, bytes] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+        self.busy = 0
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def reset(self):
+        self.calls.clear()
+        self.errors = self.busy = 0
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        await asyncio.sleep(self.latency)
+        if '/file/bot' in url:
+            self.calls['download'] += 1
+            return 200, self.files[url.rsplit('/', 1)[-1].split('.')[0]]
+
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+        if api_method == 'getMe':
+            result: Any = BOT_USER
+        elif api_method in ('sendMessage', 'editMessageText'):
+            text = str(params.get('text', ''))
+            if text.startswith('⚠️'):
+                self.errors += 1
+            elif text.startswith('⏳'):
+                self.busy += 1
+            if api_method == 'sendMessage':
+                self._message_id += 1
+            result = {
+                'message_id': params.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': params['chat_id'], 'type': 'private'},
+                'from': BOT_USER,
+                'text': text
+            }
+        elif api_method == 'getFile':
+            file_id = params['file_id']
+            result = {'file_id': file_id, 'file_unique_id': file_id,
+                      'file_size': len(self.files[file_id]), 'file_path': f"voice/{file_id}.wav"}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        words = INSIGHT_WORDS[:max(1, min(len(INSIGHT_WORDS), request.get('max_tokens', 500) // 2))]
+        prompt_tokens = sum(len(m['content']) for m in request['messages']) // 4
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+
+        if not request.get('stream'):
+            body = json.dumps({
+                'choices': [{'message': {'role': 'assistant', 'content': ' '.join(words)}}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(words)}
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # HTTP/1.0 response without a length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for i, word in enumerate(words):
+            delta = {'choices': [{'delta': {'content': word if i == 0 else ' ' + word}}]}
+            self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(server.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_openai(latency_ms: float = 800.0, token_ms: float = 5.0) -> ThreadingHTTPServer:
+    """Chat completions server (plain and streamed) on a free local port"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.latency = latency_ms / 1000.0
+    server.token_latency = token_ms / 1000.0
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server
+
+
+class FakeTranslator(TranslationBackend):
+    """googletrans stand-in: one bulk call costs `latency_ms`, texts come back unchanged"""
+
+    name = 'fake'
+
+    def __init__(self, latency_ms: float = 150.0):
+        self.latency = latency_ms / 1000.0
+
+    def translate_batch(self, texts, source, target):
+        time.sleep(self.latency)
+        return [(text, source or 'en') for text in texts]
+
+
+class FakeRecognizer(RecognizerBackend):
+    """Speech recognizer stand-in: `latency_ms` per chunk, about two words per second of audio"""
+
+    name = 'fake'
+
+    def __init__(self, latency_ms: float = 300.0):
+        self.latency = latency_ms / 1000.0
+
+    def transcribe(self, audio) -> str:
+        time.sleep(self.latency)
+        seconds = len(audio.get_raw_data()) / audio.sample_width / audio.sample_rate
+        words = [INSIGHT_WORDS[i % len(INSIGHT_WORDS)] for i in range(max(1, int(seconds * 2)))]
+        return ' '.join(words)
+
+
+def synth_voice_note(seconds: float, sample_rate: int = 16000, seed: int = 0) -> bytes:
+    """WAV clip of tone bursts ("words") separated by pauses, so silence splitting has work to do"""
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    position = 0
+    while position < len(samples):
+        burst = int(rng.uniform(0.8, 2.5) * sample_rate)
+        t = np.arange(min(burst, len(samples) - position)) / sample_rate
+        samples[position:position + len(t)] = 0.3 * np.sin(2 * np.pi * rng.uniform(150, 400) * t)
+        position += len(t) + int(rng.uniform(0.6, 1.0) * sample_rate)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+class TrafficGenerator:
+    """Builds Telegram update payloads for a scenario's command mix"""
+
+    def __init__(self, api: FakeBotAPI, users: int = 50, voice_seconds: float = 8.0, seed: int = 0):
+        from bot.benchmark import SAMPLE_TEXTS
+        self.api = api
+        self.users = users
+        self.voice_seconds = voice_seconds
+        self.sentences = SAMPLE_TEXTS
+        self.random = random.Random(seed)
+        self.update_id = 0
+
+    def text(self, sentences: int) -> str:
+        # Unique texts, so the result caches don't turn the run into a cache benchmark
+        picked = [self.random.choice(self.sentences) for _ in range(sentences)]
+        return f"{' '.join(picked)} (#{self.update_id})"
+
+    def payload(self, kind: str) -> Dict[str, Any]:
+        self.update_id += 1
+        user_id = 1 + self.random.randrange(self.users)
+        message: Dict[str, Any] = {
+            'message_id': self.update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        }
+        if kind == 'voice':
+            file_id = f"voice{self.update_id}"
+            self.api.files[file_id] = synth_voice_note(self.voice_seconds, seed=self.update_id)
+            message['voice'] = {'file_id': file_id, 'file_unique_id': file_id,
+                                'duration': int(self.voice_seconds), 'mime_type': 'audio/wav'}
+        elif kind == 'text':
+            message['text'] = self.text(self.random.randint(1, 3))
+        else:
+            args = self.text(6 if kind in ('analyze', 'deep') else 2)
+            if kind == 'translate':
+                args = f"{self.random.choice(['si', 'ta', 'fr'])} {args}"
+            command = f"/{kind}"
+            message['text'] = f"{command} {args}"
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'update_id': self.update_id, 'message': message}
+
+    def scenario(self, name: str, count: int) -> List[Dict[str, Any]]:
+        kinds, weights = zip(*SCENARIOS[name])
+        return [self.payload(kind) for kind in self.random.choices(kinds, weights, k=count)]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+async def drive(application, updates: List[Update], rate: float, concurrency: int) -> Tuple[List[float], float]:
+    """
+    Feed updates to the application, `rate` per second (0 = as fast as
+    possible) with at most `concurrency` in flight. Latency runs from an
+    update's arrival to the end of its handling, so queueing counts.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def handle(update: Update, arrived: float):
+        async with slots:
+            await application.process_update(update)
+        latencies.append(loop.time() - arrived)
+
+    start = loop.time()
+    tasks = []
+    for i, update in enumerate(updates):
+        if rate:
+            await asyncio.sleep(max(0.0, start + i / rate - loop.time()))
+        tasks.append(asyncio.ensure_future(handle(update, loop.time())))
+    await asyncio.gather(*tasks)
+    return latencies, loop.time() - start
+
+
+async def _run(args, api: FakeBotAPI, openai) -> List[Dict[str, object]]:
+    from bot import main
+    from bot.metrics import rss_bytes
+
+    from bot.translation import TranslationService
+
+    main.voice.backend = FakeRecognizer(args.speech_ms)
+    main.language.translation = TranslationService(FakeTranslator(args.translate_ms), timeout=30.0)
+    if args.warm_up:
+        main.warm_up_models()
+
+    application = main.build_application(request=api)
+    await application.initialize()
+    generator = TrafficGenerator(api, args.users, args.voice_seconds, args.seed)
+    rows = []
+    try:
+        for scenario in args.scenarios.split(','):
+            updates = [Update.de_json(payload, application.bot)
+                       for payload in generator.scenario(scenario, args.updates)]
+            api.reset()
+            llm_before, rss_before = openai.requests, rss_bytes()
+            latencies, elapsed = await drive(application, updates, args.rate, args.concurrency)
+            memory = main.memory.stats()
+            rows.append({
+                'scenario': scenario,
+                'updates': len(updates),
+                'p50_ms': f"{_percentile(latencies, 50) * 1000:.0f}",
+                'p95_ms': f"{_percentile(latencies, 95) * 1000:.0f}",
+                'p99_ms': f"{_percentile(latencies, 99) * 1000:.0f}",
+                'mean_ms': f"{statistics.mean(latencies) * 1000:.0f}",
+                'upd/s': f"{len(updates) / elapsed:.1f}",
+                'errors': api.errors,
+                'busy': api.busy,
+                'api_calls': sum(api.calls.values()),
+                'llm_calls': openai.requests - llm_before,
+                'rss_mb': f"{rss_bytes() / 2**20:.0f} ({(rss_bytes() - rss_before) / 2**20:+.0f})",
+                'memory_kb': f"{memory['bytes'] / 1024:.0f}"
+            })
+    finally:
+        await application.shutdown()
+        main.memory.close()
+    return rows
+
+
+def run_load_test(args) -> List[Dict[str, object]]:
+    """Start the fakes, point the bot's configuration at them and run every scenario"""
+    from bot.config import Config
+
+    openai = start_fake_openai(args.openai_ms, args.openai_token_ms)
+    # Must happen before bot.main is imported: its components read Config when built
+    Config.OPENAI_BASE_URL = f"http://127.0.0.1:{openai.server_address[1]}"
+    Config.OPENAI_API_KEY = 'loadtest'
+    data_dir = tempfile.mkdtemp(prefix='loadtest-')
+    Config.MEMORY_DB = f"{data_dir}/memory.db"
+    # Never exists, so a real memory.json in the working directory is left alone
+    Config.MEMORY_LEGACY_FILE = f"{data_dir}/memory.json"
+    Config.CACHE_DIR = ''
+    Config.WARMUP_MODELS = False
+    if not args.rate_limit:
+        Config.REQUESTS_PER_MINUTE = Config.GLOBAL_REQUESTS_PER_MINUTE = 10 ** 9
+
+    try:
+        return asyncio.run(_run(args, FakeBotAPI(args.telegram_ms), openai))
+    finally:
+        openai.shutdown()
@@ -1,26 +1,69 @@
+import asyncio
 import os
+import functools
+import json
 import logging
+import threading
+import time
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
     CommandHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
-from bot.ai_detective import AIDetective
+from bot.ai_detective import AIDetective, CHEAP_STAGES
+from bot.batching import batcher_stats
 from bot.humanizer import Humanizer
 from bot.memory import ConversationMemory
 from bot.language import LanguageProcessor
 from bot.voice import VoiceProcessor
 from bot.utilities import format_analysis
+from bot.executor import InferenceExecutor, QueueFullError
+from bot.cache import cache_stats
+from bot.config import Config
+from bot.lazy import is_loaded, startup_report, startup_stats, timed
+from bot.llm import get_client
+from bot.metrics import HANDLER_ERRORS, HANDLER_LATENCY, REGISTRY, family, profiler, start_http_server
+from bot.model_server import ModelClient, RemoteAIDetective, RemoteHumanizer
+from bot.outbound import OutboundQueue
+from bot.ratelimit import CHEAP, EXPENSIVE, RateLimiter
+from bot.webhook import WebhookApp
 
-# Initialize modules
-detective = AIDetective()
-humanizer = Humanizer()
-memory = ConversationMemory()
-language = LanguageProcessor()
-voice = VoiceProcessor()
+# Initialize modules (models load lazily, see warm_up_models)
+executor = InferenceExecutor()
+if Config.MODEL_SERVER_URL:
+    # Models are hosted once by `python -m bot.model_server`
+    model_client = ModelClient(Config.MODEL_SERVER_URL, Config.MODEL_SERVER_TIMEOUT)
+    detective = RemoteAIDetective(model_client)
+    humanizer = RemoteHumanizer(model_client)
+else:
+    with timed('AIDetective()'):
+        # Stage graphs run on the executor's pools, under the same limits as everything else
+        detective = AIDetective(executor.pools)
+    with timed('Humanizer()'):
+        humanizer = Humanizer()
+with timed('ConversationMemory()'):
+    memory = ConversationMemory(Config.MEMORY_LEGACY_FILE)
+with timed('LanguageProcessor()'):
+    language = LanguageProcessor()
+with timed('VoiceProcessor()'):
+    voice = VoiceProcessor(pools=executor.pools)
+rate_limiter = RateLimiter(
+    Config.REQUESTS_PER_MINUTE,
+    Config.GLOBAL_REQUESTS_PER_MINUTE,
+    expensive_cost=Config.EXPENSIVE_REQUEST_COST,
+    reserve=Config.EXPENSIVE_RESERVE
+)
+# Every reply and edit goes through here, paced to Telegram's flood limits
+outbound = OutboundQueue()
+
+EXPENSIVE_COMMANDS = {'analyze', 'deep', 'humanize'}
+
+BUSY_MESSAGE = "⏳ I'm busy with other requests right now. Please try again in a moment."
 
 # Set up logging
 logging.basicConfig(
@@ -29,117 +72,403 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def warm_up_models():
+    """Load all models in the background so the first real request is fast"""
+    try:
+        detective.warm_up()
+        humanizer.warm_up()
+        language.warm_up()
+        voice.warm_up()
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {e}")
+    logger.info(startup_report())
+
+async def post_init(application):
+    logger.info("Bot initialized")
+    if Config.WARMUP_MODELS:
+        threading.Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
+
+def track(name: str, handler):
+    """Wrap a handler to record its latency and errors, and profile it when slow"""
+    @functools.wraps(handler)
+    async def tracked(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = time.monotonic()
+        profiler.begin(started)
+        try:
+            return await handler(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.monotonic() - started, handler=name)
+            profiler.finish(name, started)
+    return tracked
+
+def _samples(stats, key):
+    return {((key, name),): value for name, value in stats.items()}
+
+def collect_metrics():
+    """Metric families read from the stats() of every component at scrape time"""
+    llm = get_client().stats()
+    yield family('bot_llm_calls_total', 'counter', 'OpenAI calls by model', _samples(llm['calls'], 'model'))
+    yield family('bot_llm_errors_total', 'counter', 'Failed OpenAI calls by model', _samples(llm['errors'], 'model'))
+    yield family('bot_llm_retries_total', 'counter', 'Retried OpenAI calls', {(): llm['retries']})
+    yield family('bot_llm_in_flight', 'gauge', 'OpenAI calls in flight', {(): llm['in_flight']})
+    yield family('bot_llm_tokens_total', 'counter', 'OpenAI tokens by model and kind', {
+        (('model', model), ('kind', kind)): count
+        for model, counts in llm['tokens'].items() for kind, count in counts.items()
+    })
+    
+    pools = executor.stats()
+    for field in ('queued', 'running'):
+        yield family(f'bot_executor_{field}', 'gauge', f'Inference jobs {field} per pool',
+                     {(('pool', kind),): stats[field] for kind, stats in pools.items()})
+    for field in ('completed', 'failed', 'rejected'):
+        yield family(f'bot_executor_{field}_total', 'counter', f'Inference jobs {field} per pool',
+                     {(('pool', kind),): stats[field] for kind, stats in pools.items()})
+    
+    batchers = batcher_stats()
+    yield family('bot_batcher_queued', 'gauge', 'Items waiting for a batch',
+                 {(('batcher', name),): stats['queued'] for name, stats in batchers.items()})
+    yield family('bot_batcher_items_total', 'counter', 'Items run through each batcher',
+                 {(('batcher', name),): stats['items'] for name, stats in batchers.items()})
+    yield family('bot_batcher_batches_total', 'counter', 'Batches run by each batcher',
+                 {(('batcher', name),): stats['batches'] for name, stats in batchers.items()})
+    
+    caches = cache_stats()
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                        ('entries', 'gauge'), ('bytes', 'gauge'), ('hit_rate', 'gauge')):
+        name = f'bot_cache_{field}_total' if kind == 'counter' else f'bot_cache_{field}'
+        yield family(name, kind, f'Result cache {field}',
+                     {(('cache', cache),): stats[field] for cache, stats in caches.items()})
+    
+    limits = rate_limiter.stats()
+    yield family('bot_rate_limit_allowed_total', 'counter', 'Requests let through by priority',
+                 _samples(limits['allowed'], 'priority'))
+    yield family('bot_rate_limit_limited_total', 'counter', 'Requests rate limited by priority',
+                 _samples(limits['limited'], 'priority'))
+    
+    sending = outbound.stats()
+    yield family('bot_outbound_queued', 'gauge', 'Messages and edits waiting to be sent', {(): sending['queued']})
+    for field in ('sent', 'edited', 'deleted', 'coalesced', 'retry_afters', 'failed'):
+        yield family(f'bot_outbound_{field}_total', 'counter', f'Outbound messages {field}', {(): sending[field]})
+    
+    resident = memory.stats()
+    yield family('bot_memory_users', 'gauge', 'Users held in conversation memory', {(): resident['resident_users']})
+    yield family('bot_memory_bytes', 'gauge', 'Bytes held in conversation memory', {(): resident['bytes']})
+    
+    if application.ready:
+        webhook = application.stats()
+        yield family('bot_webhook_queued', 'gauge', 'Updates waiting for a webhook worker', {(): webhook['queued']})
+        for field in ('received', 'rejected', 'processed', 'failed'):
+            yield family(f'bot_webhook_{field}_total', 'counter', f'Webhook updates {field}', {(): webhook[field]})
+    
+    if is_loaded(language, 'translation'):
+        translation = language.translation.stats()
+        for field in ('requests', 'batches', 'failures', 'timeouts', 'degraded', 'breaker_trips'):
+            yield family(f'bot_translation_{field}_total', 'counter', f'Translation {field}', {(): translation[field]})
+
+REGISTRY.register_collector(collect_metrics)
+
+def request_priority(update: Update) -> str:
+    """Classify an update as cheap or expensive work"""
+    message = update.message
+    if message.voice:
+        return EXPENSIVE
+    if message.text and message.text.startswith('/'):
+        command = message.text[1:].split(maxsplit=1)[0].split('@')[0].lower()
+        if command in EXPENSIVE_COMMANDS:
+            return EXPENSIVE
+    return CHEAP
+
+async def rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every handler: enforces size and rate limits, shedding load early"""
+    if not update.message or not update.effective_user:
+        return
+    if update.effective_user.id in Config.ADMIN_IDS:
+        return
+    
+    text = update.message.text or ''
+    if len(text) > Config.MESSAGE_CHAR_LIMIT:
+        await outbound.reply(
+            update.message,
+            f"✂️ That message is too long. Please keep it under {Config.MESSAGE_CHAR_LIMIT} characters."
+        )
+        raise ApplicationHandlerStop
+    
+    wait = rate_limiter.check(update.effective_user.id, request_priority(update))
+    if wait:
+        retry_in = 60 if wait == float('inf') else max(1, int(wait + 0.999))
+        await outbound.reply(update.message, f"⏳ I'm busy right now, please retry in {retry_in}s.")
+        raise ApplicationHandlerStop
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     welcome_msg = (
         f"👋 Hi {user.first_name}! I'm your AI Detective Bot.\n\n"
         "🔍 Send me text to analyze or use these commands:\n"
-        "/analyze - Deep AI analysis\n"
+        "/analyze - AI analysis (deep for longer texts)\n"
+        "/deep - Full analysis with AI insights\n"
         "/humanize - Make text natural\n"
         "/language - Detect language\n"
+        "/translate - Translate text (e.g. /translate si Hello)\n"
         "/help - Show all commands"
     )
-    await update.message.reply_text(welcome_msg)
+    await outbound.reply(update.message, welcome_msg)
 
-async def analyze_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def analyze_text(update: Update, context: ContextTypes.DEFAULT_TYPE, deep: bool = False):
     text = ' '.join(context.args) or memory.recall(update.effective_user.id, 'last_message')
     if not text:
-        await update.message.reply_text("Please provide text to analyze or send a message first.")
+        await outbound.reply(update.message, "Please provide text to analyze or send a message first.")
         return
     
     try:
-        analysis = detective.analyze(text)
+        # Cheap stages first, so the user gets a partial report right away
+        stages = detective.plan(text, deep)
+        pending = [stage for stage in stages if stage not in CHEAP_STAGES]
+        cheap = [stage for stage in stages if stage in CHEAP_STAGES]
+        # run_stages only coordinates; its stages are queued on the executor's pools
+        analysis = await asyncio.to_thread(detective.run_stages, text, cheap, reject_when_full=True)
+        shown = format_analysis(analysis, pending)
+        reply = await outbound.reply(update.message, shown)
+        
+        # Expensive stages run concurrently; edit the report in place as each one lands
+        if pending:
+            loop = asyncio.get_running_loop()
+            landed: asyncio.Queue = asyncio.Queue()
+            on_stage = lambda stage, report: loop.call_soon_threadsafe(landed.put_nowait, (stage, report))
+            job = asyncio.ensure_future(asyncio.to_thread(
+                detective.run_stages, text, pending, on_stage=on_stage, priority=EXPENSIVE, reject_when_full=True
+            ))
+            try:
+                while pending and not job.done():
+                    next_stage = asyncio.ensure_future(landed.get())
+                    await asyncio.wait({next_stage, job}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_stage.done():
+                        next_stage.cancel()
+                        break
+                    stage, analysis = next_stage.result()
+                    if stage in pending:
+                        pending.remove(stage)
+                        shown = format_analysis(analysis, pending)
+                        outbound.edit(reply, shown)
+                analysis = await job
+            except Exception as e:
+                if isinstance(e, QueueFullError):
+                    logger.warning(f"Backpressure on /analyze expensive stages: {executor.stats()[e.kind]}")
+                else:
+                    logger.error(f"Expensive analysis stages failed: {e}")
+                # Keep the report already shown, with the stages that never landed marked as skipped
+                analysis = {**analysis, 'incomplete': list(dict.fromkeys(analysis.get('incomplete', []) + pending))}
+            # Unchanged text costs no API call; awaiting also flushes the queued edits
+            await outbound.edit(reply, format_analysis(analysis))
+        
         memory.store(update.effective_user.id, 'last_analysis', analysis)
-        await update.message.reply_text(format_analysis(analysis))
+    except QueueFullError as e:
+        logger.warning(f"Backpressure on /analyze: {executor.stats()[e.kind]}")
+        await outbound.reply(update.message, BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
-        await update.message.reply_text("⚠️ Analysis failed. Please try again.")
+        await outbound.reply(update.message, "⚠️ Analysis failed. Please try again.")
+
+async def deep_analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await analyze_text(update, context, deep=True)
 
 async def humanize_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = ' '.join(context.args) or memory.recall(update.effective_user.id, 'last_message')
     if not text:
-        await update.message.reply_text("Please provide text to humanize or send a message first.")
+        await outbound.reply(update.message, "Please provide text to humanize or send a message first.")
         return
     
     try:
-        humanized = humanizer.humanize(text)
-        await update.message.reply_text(f"💬 Humanized version:\n\n{humanized}")
+        plan = humanizer.plan()
+        if plan in ('t5', 'both'):
+            text = await executor.run('model', humanizer.paraphrase, text, priority=EXPENSIVE)
+        reply = await outbound.reply(update.message, "💬 Humanizing...")
+        
+        # Stream the style rewrite into the reply, editing at most once per interval
+        styled, shown, last_edit = text, '', time.monotonic()
+        if plan in ('llm', 'both'):
+            async for styled in humanizer.stream_style(text, plan=plan):
+                if time.monotonic() - last_edit >= Config.STREAM_EDIT_INTERVAL and styled != shown:
+                    outbound.edit(reply, f"💬 Humanized version:\n\n{styled} ▌")
+                    shown, last_edit = styled, time.monotonic()
+        
+        # Sentence splitting may still need to load (or download) punkt, so not on the event loop
+        humanized = await executor.run('model', humanizer.finish, styled)
+        await outbound.edit(reply, f"💬 Humanized version:\n\n{humanized}")
+    except QueueFullError as e:
+        logger.warning(f"Backpressure on /humanize: {executor.stats()[e.kind]}")
+        await outbound.reply(update.message, BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Humanization failed: {e}")
-        await update.message.reply_text("⚠️ Humanization failed. Please try again.")
+        await outbound.reply(update.message, "⚠️ Humanization failed. Please try again.")
 
 async def detect_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = ' '.join(context.args) or memory.recall(update.effective_user.id, 'last_message')
     if not text:
-        await update.message.reply_text("Please provide text or send a message first.")
+        await outbound.reply(update.message, "Please provide text or send a message first.")
         return
     
     try:
-        lang = language.detect(text)
-        await update.message.reply_text(f"🌐 Detected language: {lang}")
+        lang = await executor.run('model', language.detect, text)
+        await outbound.reply(update.message, f"🌐 Detected language: {lang}")
+    except QueueFullError as e:
+        logger.warning(f"Backpressure on /language: {executor.stats()[e.kind]}")
+        await outbound.reply(update.message, BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Language detection failed: {e}")
-        await update.message.reply_text("⚠️ Language detection failed.")
+        await outbound.reply(update.message, "⚠️ Language detection failed.")
+
+async def translate_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = list(context.args)
+    target = Config.DEFAULT_LANGUAGE
+    if args and args[0].lower() in language.language_names:
+        target = args.pop(0).lower()
+    text = ' '.join(args) or memory.recall(update.effective_user.id, 'last_message')
+    if not text:
+        await outbound.reply(update.message, "Please provide text to translate or send a message first.")
+        return
+    
+    translated, source = await language.translate(text, target)
+    if translated is None:
+        await outbound.reply(update.message, "⚠️ Translation is unavailable right now. Please try again later.")
+        return
+    await outbound.reply(
+        update.message,
+        f"🌐 {source} → {language.language_names.get(target, target)}:\n\n{translated}"
+    )
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text
     memory.store(user_id, 'last_message', text)
     
-    quick_analysis = detective.quick_analyze(text)
+    try:
+        quick_analysis = await asyncio.to_thread(detective.quick_analyze, text, reject_when_full=True)
+    except QueueFullError as e:
+        logger.warning(f"Backpressure on quick analysis: {executor.stats()[e.kind]}")
+        await outbound.reply(update.message, BUSY_MESSAGE)
+        return
+    
     response = (
         f"🔍 Quick Analysis:\n\n"
         f"📊 Sentiment: {quick_analysis['sentiment']}\n"
         f"🏷️ Key Entities: {', '.join(quick_analysis['entities'][:5])}\n\n"
         f"Use /analyze for deeper inspection or /humanize to make this more natural."
     )
-    await update.message.reply_text(response)
+    await outbound.reply(update.message, response)
 
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.voice.duration > Config.VOICE_MAX_SECONDS:
+        await outbound.reply(
+            update.message,
+            f"✂️ That voice note is too long. Please keep it under {Config.VOICE_MAX_SECONDS:.0f} seconds."
+        )
+        return
+    
     try:
+        # Download and decode in memory: no temp files in the working directory
         voice_file = await update.message.voice.get_file()
-        voice_path = f"voice_{update.update_id}.ogg"
-        await voice_file.download_to_drive(voice_path)
+        data = await voice_file.download_as_bytearray()
+        chunks = await executor.run('model', voice.prepare, bytes(data), priority=EXPENSIVE)
+        reply = await outbound.reply(update.message, "🎤 Transcribing...")
         
-        text = voice.to_text(voice_path)
-        os.remove(voice_path)
+        # Chunks are transcribed in parallel; show the transcript as it grows
+        text, shown, last_edit = '', '', time.monotonic()
+        async for text in voice.stream_text(chunks):
+            if time.monotonic() - last_edit >= Config.STREAM_EDIT_INTERVAL and text != shown:
+                outbound.edit(reply, f"🎤 Transcribed text:\n\n{text} ▌")
+                shown, last_edit = text, time.monotonic()
         
+        if not text:
+            await outbound.edit(reply, "🎤 Sorry, I couldn't make out any speech in that voice note.")
+            return
         memory.store(update.effective_user.id, 'last_message', text)
-        await update.message.reply_text(f"🎤 Transcribed text:\n\n{text}")
+        await outbound.edit(reply, f"🎤 Transcribed text:\n\n{text}")
+    except QueueFullError as e:
+        logger.warning(f"Backpressure on voice: {executor.stats()[e.kind]}")
+        await outbound.reply(update.message, BUSY_MESSAGE)
     except Exception as e:
         logger.error(f"Voice processing failed: {e}")
-        await update.message.reply_text("⚠️ Voice message processing failed.")
+        await outbound.reply(update.message, "⚠️ Voice message processing failed.")
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in Config.ADMIN_IDS:
+        return
+    # A remote detective answers over HTTP, so keep it off the event loop
+    stages = await asyncio.to_thread(detective.stage_stats)
+    stats = {
+        'inference': executor.stats(),
+        'llm': get_client().stats(),
+        'translation': language.translation.stats() if is_loaded(language, 'translation') else {},
+        'rate_limit': rate_limiter.stats(),
+        'outbound': outbound.stats(),
+        'webhook': application.stats() if application.ready else {},
+        'stages': stages,
+        'cache': cache_stats(),
+        'memory': memory.stats(),
+        'startup': startup_stats()
+    }
+    await outbound.reply(update.message, f"📈 Bot stats:\n\n{json.dumps(stats, indent=2)}")
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Update {update} caused error {context.error}")
     if update and hasattr(update, 'effective_chat'):
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text="⚠️ Sorry, I encountered an error processing your request."
+        await outbound.send(
+            context.bot,
+            update.effective_chat.id,
+            "⚠️ Sorry, I encountered an error processing your request."
         )
 
-def main():
-    application = ApplicationBuilder() \
+def build_application(request=None):
+    """Build the Telegram application with all handlers registered.
+    `request` replaces the HTTP layer to the Bot API (e.g. with a fake for tests)."""
+    builder = ApplicationBuilder() \
         .token(os.getenv('TELEGRAM_TOKEN')) \
-        .post_init(lambda _: logger.info("Bot initialized")) \
-        .build()
+        .post_init(post_init)
+    if Config.TELEGRAM_API_URL:
+        builder = builder.base_url(Config.TELEGRAM_API_URL)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    
+    # Rate limiting runs first, in its own group
+    application.add_handler(TypeHandler(Update, track('rate_limit', rate_limit)), group=-1)
     
     # Command handlers
-    application.add_handler(CommandHandler('start', start))
-    application.add_handler(CommandHandler('help', start))
-    application.add_handler(CommandHandler('analyze', analyze_text))
-    application.add_handler(CommandHandler('humanize', humanize_text))
-    application.add_handler(CommandHandler('language', detect_language))
+    application.add_handler(CommandHandler('start', track('start', start)))
+    application.add_handler(CommandHandler('help', track('help', start)))
+    application.add_handler(CommandHandler('analyze', track('analyze', analyze_text)))
+    application.add_handler(CommandHandler('deep', track('deep', deep_analyze)))
+    application.add_handler(CommandHandler('humanize', track('humanize', humanize_text)))
+    application.add_handler(CommandHandler('language', track('language', detect_language)))
+    application.add_handler(CommandHandler('translate', track('translate', translate_text)))
+    application.add_handler(CommandHandler('stats', track('stats', show_stats)))
     
     # Message handlers
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    application.add_handler(MessageHandler(filters.VOICE, handle_voice))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, track('message', handle_message)))
+    application.add_handler(MessageHandler(filters.VOICE, track('voice', handle_voice)))
     
     # Error handler
     application.add_error_handler(error_handler)
     
-    # Start the bot
-    application.run_polling()
+    return application
+
+# ASGI entry point for webhook mode (see Procfile); the Telegram application
+# itself is built on ASGI startup, so importing this module needs no token
+application = WebhookApp(build_application)
+
+def main():
+    if Config.METRICS_PORT:
+        start_http_server(Config.METRICS_PORT)
+    if Config.BOT_MODE == 'webhook':
+        import uvicorn
+        uvicorn.run(application, host='0.0.0.0', port=Config.PORT)
+    else:
+        build_application().run_polling()
 
 if __name__ == '__main__':
     main()
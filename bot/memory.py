@@ -1,38 +1,138 @@
-from typing import Any, Dict
-from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
 import json
-import os
+import threading
+import time
+import zlib
+from bot.config import Config
+from bot.storage import MemoryStorage, create_storage
+
+# Values longer than this are zlib-compressed while resident
+COMPRESS_THRESHOLD = 256
+# Rough per-entry bookkeeping cost added to the byte budget
+ENTRY_OVERHEAD = 64
+
+def _encode(value: Any) -> bytes:
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+def _decode(blob: bytes) -> Any:
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b'z' else blob[1:]
+    return json.loads(raw)
 
 class ConversationMemory:
-    def __init__(self, persistence_file="memory.json"):
-        self.memory = defaultdict(dict)
+    """
+    Per-user key/value memory with a bounded resident set.
+
+    Resident values are kept JSON-encoded (zlib-compressed when large) and
+    counted against `max_bytes`; the least recently used users are evicted
+    first and transparently reloaded from storage when they come back.
+    Keys can have a TTL (see Config.MEMORY_KEY_TTLS) after which they are
+    treated as missing both in memory and in storage.
+    """
+
+    def __init__(self, persistence_file="memory.json", storage: Optional[MemoryStorage] = None,
+                 max_bytes: Optional[int] = None, key_ttls: Optional[Dict[str, float]] = None):
+        self.memory: "OrderedDict[int, Dict[str, Tuple[Optional[float], bytes]]]" = OrderedDict()
         self.persistence_file = persistence_file
-        self._load()
+        self.storage = storage or create_storage(
+            Config.MEMORY_BACKEND,
+            Config.MEMORY_DB,
+            legacy_path=persistence_file,
+            flush_interval=Config.MEMORY_FLUSH_INTERVAL,
+            compact_interval=Config.MEMORY_COMPACT_INTERVAL
+        )
+        self.max_bytes = Config.MEMORY_MAX_BYTES if max_bytes is None else max_bytes
+        self.key_ttls = Config.MEMORY_KEY_TTLS if key_ttls is None else key_ttls
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
 
     def store(self, user_id: int, key: str, value: Any):
-        self.memory[user_id][key] = value
-        self._save()
+        ttl = self.key_ttls.get(key)
+        expires_at = time.time() + ttl if ttl else None
+        blob = _encode(value)
+        with self._lock:
+            entries = self._user(user_id, create=True)
+            self._drop_entry(entries, key)
+            entries[key] = (expires_at, blob)
+            self.bytes += len(blob) + len(key) + ENTRY_OVERHEAD
+            self._evict(keep=user_id)
+        self.storage.put(user_id, key, value, expires_at)
 
     def recall(self, user_id: int, key: str, default=None) -> Any:
-        return self.memory[user_id].get(key, default)
+        with self._lock:
+            entries = self._user(user_id)
+            if not entries or key not in entries:
+                return default
+            expires_at, blob = entries[key]
+            if expires_at is not None and expires_at < time.time():
+                self._drop_entry(entries, key)
+                self.expirations += 1
+                return default
+        return _decode(blob)
 
     def clear(self, user_id: int):
-        if user_id in self.memory:
-            del self.memory[user_id]
-            self._save()
-
-    def _save(self):
-        try:
-            with open(self.persistence_file, 'w') as f:
-                json.dump(dict(self.memory), f)
-        except Exception as e:
-            print(f"Failed to save memory: {e}")
-
-    def _load(self):
-        if os.path.exists(self.persistence_file):
-            try:
-                with open(self.persistence_file, 'r') as f:
-                    data = json.load(f)
-                    self.memory.update({int(k): v for k, v in data.items()})
-            except Exception as e:
-                print(f"Failed to load memory: {e}")
+        with self._lock:
+            entries = self.memory.pop(user_id, None)
+            if entries:
+                for key in list(entries):
+                    self._drop_entry(entries, key)
+        self.storage.delete_user(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Resident-set numbers for sizing dynos"""
+        with self._lock:
+            return {
+                'resident_users': len(self.memory),
+                'resident_entries': sum(len(entries) for entries in self.memory.values()),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def close(self):
+        self.storage.close()
+
+    def _user(self, user_id: int, create: bool = False) -> Optional[Dict[str, Tuple[Optional[float], bytes]]]:
+        """Return a user's resident entries, loading them from storage if needed.
+
+        Unknown users are only inserted when `create` is set, so lookups for
+        users we have never seen don't grow the resident set.
+        """
+        entries = self.memory.get(user_id)
+        if entries is not None:
+            self.memory.move_to_end(user_id)
+            return entries
+
+        entries = {}
+        for key, (value, expires_at) in self.storage.load_user(user_id).items():
+            blob = _encode(value)
+            entries[key] = (expires_at, blob)
+            self.bytes += len(blob) + len(key) + ENTRY_OVERHEAD
+        if entries or create:
+            self.memory[user_id] = entries
+            self._evict(keep=user_id)
+            return entries
+        return None
+
+    def _drop_entry(self, entries: Dict[str, Tuple[Optional[float], bytes]], key: str):
+        entry = entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1]) + len(key) + ENTRY_OVERHEAD
+
+    def _evict(self, keep: int):
+        """Drop least recently used users until we are back under budget"""
+        while self.bytes > self.max_bytes and len(self.memory) > 1:
+            user_id = next(iter(self.memory))
+            if user_id == keep:
+                self.memory.move_to_end(user_id)
+                continue
+            entries = self.memory.pop(user_id)
+            for key in list(entries):
+                self._drop_entry(entries, key)
+            self.evictions += 1
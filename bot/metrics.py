@@ -0,0 +1,315 @@
+"""
+Process metrics in the Prometheus text format, plus an opt-in sampling profiler.
+
+Latencies are recorded into histograms as they happen; everything that is
+already tracked elsewhere (LLM tokens, pool queues, cache hit rates...) is
+read through collector callbacks only when /metrics is scraped, so the hot
+path pays for one histogram update and nothing else.
+
+    from bot.metrics import STAGE_LATENCY
+    with STAGE_LATENCY.time(component='humanizer', stage='paraphrase'):
+        ...
+"""
+import bisect
+import contextvars
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Spans (thread id, start, end or None) of the request being handled, see SamplingProfiler.begin
+_request_spans: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar('request_spans', default=None)
+
+# (metric name, type, help, {label tuple: value}) as returned by collectors
+Family = Tuple[str, str, str, Dict[Tuple[Tuple[str, str], ...], float]]
+
+
+def _labels(pairs: Iterable[Tuple[str, str]], extra: str = '') -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in pairs]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f"{self.name}_bucket{_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a callback that reports metric families at scrape time"""
+        with self._lock:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics):
+            lines.extend(metric.render())
+        for collector in list(self.collectors):
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {collector.__name__} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in samples.items():
+                    lines.append(f"{name}{_labels(key)} {float(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_seconds', 'Time spent in each Telegram handler', ('handler',)
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Exceptions escaping each Telegram handler', ('handler',)
+)
+STAGE_LATENCY = Histogram(
+    'bot_stage_seconds', 'Time spent in each model/pipeline stage', ('component', 'stage')
+)
+
+
+def family(name: str, kind: str, help: str, samples: Dict[tuple, float]) -> Family:
+    return name, kind, help, samples
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _process_collector() -> Iterable[Family]:
+    yield family('process_resident_memory_bytes', 'gauge', 'Resident memory size', {(): rss_bytes()})
+    yield family('process_threads', 'gauge', 'Live Python threads', {(): threading.active_count()})
+
+
+REGISTRY.register_collector(_process_collector)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        data = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread, on a port that can be kept private"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
+
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler for slow requests.
+
+    A daemon thread samples every thread's stack each `interval_ms` into a
+    bounded ring buffer. A request records which threads worked for it and
+    when: the event loop thread for its whole duration (`begin`), and every
+    pool thread for the jobs it ran on the request's behalf (`traced`, which
+    BoundedPool applies to every job). When the request turns out slower
+    than `slow_ms`, the samples of those threads in those spans are written
+    to `out_dir` from a background thread as folded stacks
+    (`frame;frame;frame count`), the input format of flamegraph.pl and
+    speedscope. Samples of the loop thread include whatever other requests
+    it interleaved; pool threads are exact.
+    """
+
+    def __init__(self, interval_ms: float = 10.0, slow_ms: float = 2000.0,
+                 out_dir: str = 'profiles', max_samples: int = 60000):
+        self.interval = interval_ms / 1000.0
+        self.slow = slow_ms / 1000.0
+        self.out_dir = out_dir
+        self._samples: deque = deque(maxlen=max_samples)  # (timestamp, thread id, folded stack)
+        self._thread: Optional[threading.Thread] = None
+        self.dumps = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            now = time.monotonic()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self._samples.append((now, thread_id, ';'.join(reversed(stack))))
+            time.sleep(self.interval)
+
+    def begin(self, started: float):
+        """Start recording the current request's threads (call from its task, before it awaits anything)"""
+        if self._thread is not None:
+            _request_spans.set([(threading.get_ident(), started, None)])
+
+    def traced(self, func: Callable[[], object]) -> Callable[[], object]:
+        """Wrap a job handed to another thread so its time counts towards the current request"""
+        spans = _request_spans.get()
+        if spans is None:
+            return func
+        context = contextvars.copy_context()
+
+        def run():
+            start = time.monotonic()
+            try:
+                # In the request's context, so jobs it submits in turn are traced too
+                return context.run(func)
+            finally:
+                spans.append((threading.get_ident(), start, time.monotonic()))
+        return run
+
+    def finish(self, name: str, started: float) -> Optional[str]:
+        """Dump the request's samples if it was slow; returns the path the profile is written to"""
+        ended = time.monotonic()
+        spans = _request_spans.get()
+        if self._thread is None or spans is None or ended - started < self.slow:
+            return None
+        path = os.path.join(self.out_dir, f"{name}-{int(time.time() * 1000)}.folded")
+        threading.Thread(
+            target=self._dump, args=(path, name, started, ended, list(spans)), name='profile-dump', daemon=True
+        ).start()
+        return path
+
+    def _dump(self, path: str, name: str, started: float, ended: float, spans: list):
+        counts: Dict[str, int] = defaultdict(int)
+        for timestamp, thread_id, stack in list(self._samples):
+            if started <= timestamp <= ended and any(
+                    thread == thread_id and start <= timestamp <= (end or ended) for thread, start, end in spans):
+                counts[stack] += 1
+        if not counts:
+            return
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            with open(path, 'w') as f:
+                for stack, count in sorted(counts.items()):
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning(f"Failed to write profile {path}: {e}")
+            return
+        self.dumps += 1
+        logger.info(f"Slow {name} ({ended - started:.2f}s): profile written to {path}")
+
+
+profiler = SamplingProfiler(Config.PROFILE_INTERVAL_MS, Config.PROFILE_SLOW_MS, Config.PROFILE_DIR)
+if Config.PROFILE_SLOW_MS > 0:
+    profiler.start()
@@ -0,0 +1,295 @@
+"""
+Local model server shared by several bot worker processes.
+
+Hosts one AIDetective and one Humanizer and serves them over localhost
+HTTP/JSON, so `gunicorn -w 4` workers don't each load every transformer.
+Requests are handled on threads, which lets concurrent calls from different
+workers meet in the detective's micro-batchers and share forward passes.
+POST /stream/run_stages answers with newline-delimited JSON, one line per
+finished stage and a last one with the result, so remote workers can edit
+their partial reports as stages land just like in-process ones.
+
+Run it next to the bot in the same dyno/container:
+    python -m bot.model_server
+and point the workers at it with MODEL_SERVER_URL=http://127.0.0.1:8765
+"""
+import http.client
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from bot.ai_detective import plan_stages
+from bot.config import Config
+from bot.executor import QueueFullError
+from bot.humanizer import Humanizer
+from bot.metrics import render
+from bot.ratelimit import CHEAP
+
+logger = logging.getLogger(__name__)
+
+
+class ModelServerError(RuntimeError):
+    """Raised by the client when the model server reports a failure"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: "ModelServer"
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', 'methods': sorted(self.server.methods)})
+        elif self.path == '/metrics':
+            self._send(200, render().encode('utf-8'), 'text/plain; version=0.0.4')
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.startswith('/stream/'):
+            method = self.server.streaming.get(self.path[len('/stream/'):])
+            if method is not None:
+                self._stream(method)
+                return
+        method = self.server.methods.get(self.path.lstrip('/'))
+        if method is None:
+            self._reply(404, {'error': f'unknown method {self.path}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            result = method(*payload.get('args', []), **payload.get('kwargs', {}))
+            self._reply(200, {'result': result})
+        except QueueFullError as e:
+            self._reply(503, {'error': str(e), 'kind': e.kind})
+        except Exception as e:
+            logger.error(f"Model server call {self.path} failed: {e}")
+            self._reply(500, {'error': str(e)})
+
+    def _stream(self, method):
+        """Call method with an on_stage callback that sends each stage as one chunked NDJSON line"""
+        length = int(self.headers.get('Content-Length', 0))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def emit(body: Dict[str, Any]):
+            data = json.dumps(body).encode('utf-8') + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        try:
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                result = method(*payload.get('args', []), **payload.get('kwargs', {}),
+                                on_stage=lambda stage, report: emit({'stage': stage, 'report': report}))
+                emit({'result': result})
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except QueueFullError as e:
+                emit({'error': str(e), 'kind': e.kind})
+            except Exception as e:
+                logger.error(f"Model server call {self.path} failed: {e}")
+                emit({'error': str(e)})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"Client went away during {self.path}")
+            self.close_connection = True
+
+    def _reply(self, status: int, body: Dict[str, Any]):
+        self._send(status, json.dumps(body).encode('utf-8'), 'application/json')
+
+    def _send(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, detective=None, humanizer=None):
+        if detective is None:
+            from bot.ai_detective import AIDetective
+            detective = AIDetective()
+        if humanizer is None:
+            humanizer = Humanizer()
+        self.detective = detective
+        self.humanizer = humanizer
+        self.methods = {
+            'analyze': self.detective.analyze,
+            'quick_analyze': self.detective.quick_analyze,
+            'run_stages': self.detective.run_stages,
+            'stage_stats': self.detective.stage_stats,
+            'humanize': self.humanizer.humanize,
+            'paraphrase': self.humanizer.paraphrase,
+        }
+        # Methods that take an on_stage callback, served on /stream/<name>
+        self.streaming = {
+            'run_stages': self.detective.run_stages,
+        }
+        super().__init__((host, port), _Handler)
+
+    def warm_up(self):
+        self.detective.warm_up()
+        self.humanizer.warm_up()
+
+
+def _error(payload: Dict[str, Any], status: int = 200) -> Exception:
+    """The exception for an error reply; a full pool on the server is backpressure, as locally"""
+    if 'kind' in payload:
+        return QueueFullError(payload['kind'])
+    return ModelServerError(payload.get('error', f'HTTP {status}'))
+
+
+class ModelClient:
+    """Small keep-alive JSON client; one connection per calling thread"""
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        response = self._post(f'/{method}', args, kwargs)
+        payload = json.loads(response.read())
+        if response.status != 200:
+            raise _error(payload, response.status)
+        return payload['result']
+
+    def stream(self, method: str, *args, **kwargs) -> Iterator[Dict[str, Any]]:
+        """Yield the NDJSON events of a /stream/<method> call; the last one holds the result"""
+        response = self._post(f'/stream/{method}', args, kwargs)
+        if response.status != 200:
+            raise _error(json.loads(response.read()), response.status)
+        drained = False
+        try:
+            for line in response:
+                event = json.loads(line)
+                if 'error' in event:
+                    raise _error(event)
+                if 'result' in event:
+                    # Read the closing chunk first, so the connection is reusable once the caller has the result
+                    response.read()
+                    drained = True
+                yield event
+            drained = True
+        finally:
+            if not drained:
+                # Unread chunks would corrupt the next call on this keep-alive connection
+                self._local.conn.close()
+                self._local.conn = None
+
+    def _post(self, path: str, args, kwargs) -> http.client.HTTPResponse:
+        body = json.dumps({'args': args, 'kwargs': kwargs})
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('POST', path, body, {'Content-Type': 'application/json'})
+                return conn.getresponse()
+            except (ConnectionError, http.client.HTTPException):
+                # Stale keep-alive connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+
+class RemoteAIDetective:
+    """Drop-in AIDetective that forwards calls to the model server"""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        return self.client.call('analyze', text)
+
+    def quick_analyze(self, text: str, reject_when_full: bool = False) -> Dict[str, Any]:
+        return self.client.call('quick_analyze', text, reject_when_full=reject_when_full)
+
+    def plan(self, text: str, deep: bool = False) -> List[str]:
+        return plan_stages(text, deep)
+
+    def run_stages(self, text: str, stages, on_stage=None, priority: str = CHEAP,
+                   reject_when_full: bool = False) -> Dict[str, Any]:
+        kwargs = {'priority': priority, 'reject_when_full': reject_when_full}
+        if on_stage is None:
+            return self.client.call('run_stages', text, list(stages), **kwargs)
+        # Stage completions are streamed back as they happen on the server
+        for event in self.client.stream('run_stages', text, list(stages), **kwargs):
+            if 'result' in event:
+                return event['result']
+            on_stage(event['stage'], event['report'])
+        raise ModelServerError("Model server closed the stream without a result")
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        return self.client.call('stage_stats')
+
+    def warm_up(self):
+        pass
+
+
+class RemoteHumanizer(Humanizer):
+    """
+    Humanizer whose model passes run on the model server.
+
+    The LLM style rewrite and the final natural-features pass don't need
+    local weights, so they (and streaming) are inherited unchanged.
+    """
+
+    def __init__(self, client: ModelClient):
+        super().__init__()
+        self.client = client
+
+    def humanize(self, text: str, style: str = 'casual', plan: Optional[str] = None) -> str:
+        return self.client.call('humanize', text, style=style, plan=plan)
+
+    def paraphrase(self, text: str) -> str:
+        return self.client.call('paraphrase', text)
+
+    def warm_up(self):
+        pass
+
+
+def main(argv: List[str] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the bot's models to local workers")
+    parser.add_argument('--host', default=Config.MODEL_SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.MODEL_SERVER_PORT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    server = ModelServer(args.host, args.port)
+    server.warm_up()
+    logger.info(f"Model server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
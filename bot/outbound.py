@@ -0,0 +1,211 @@
+"""
+Outbound message queue that keeps replies within Telegram's flood limits.
+
+Handlers hand their replies and edits to `OutboundQueue` instead of calling
+the Bot API themselves. Every chat has a FIFO drained by its own task and
+paced by a per-chat token bucket (a slower one for groups) plus one global
+bucket, so bursts go out at the highest rate Telegram allows instead of
+tripping 429s. A RetryAfter pauses that chat for the time Telegram asks
+and the call is retried. An edit queued while an earlier send or edit of
+the same reply is still waiting replaces that one's text, so a fast
+stream of edits collapses into the latest. Texts over MESSAGE_CHAR_LIMIT
+are split over several messages, which later edits update in place.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from telegram.constants import ChatType
+from telegram.error import BadRequest, RetryAfter
+
+from bot.config import Config
+from bot.ratelimit import TokenBucket
+from bot.utilities import split_long_message
+
+logger = logging.getLogger(__name__)
+
+GROUP_CHATS = (ChatType.GROUP, ChatType.SUPERGROUP, ChatType.CHANNEL)
+
+
+class Reply:
+    """One logical reply, which may span several Telegram messages"""
+
+    def __init__(self, bot, chat_id: int, group: bool = False, reply_to: Optional[int] = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.group = group
+        self.reply_to = reply_to
+        self.messages: List[Any] = []
+        self.parts: List[str] = []
+
+
+class _Job:
+    __slots__ = ('reply', 'text', 'future')
+
+    def __init__(self, reply: Reply, text: str, future: asyncio.Future):
+        self.reply = reply
+        self.text = text
+        self.future = future
+
+
+def _consume(future: asyncio.Future):
+    # Intermediate edits are often not awaited; don't warn about their errors
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundQueue:
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(self, global_per_second: Optional[float] = None, chat_per_second: Optional[float] = None,
+                 chat_burst: Optional[int] = None, group_per_minute: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        global_rate = global_per_second or Config.OUTBOUND_GLOBAL_PER_SECOND
+        self.chat_rate = chat_per_second or Config.OUTBOUND_CHAT_PER_SECOND
+        self.chat_burst = chat_burst or Config.OUTBOUND_CHAT_BURST
+        self.group_rate = (group_per_minute or Config.OUTBOUND_GROUP_PER_MINUTE) / 60.0
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._tasks = set()
+        self.sent = 0
+        self.edited = 0
+        self.deleted = 0
+        self.coalesced = 0
+        self.retry_afters = 0
+        self.failed = 0
+
+    async def reply(self, message, text: str) -> Reply:
+        """Answer a user's message (quoting it in groups, like Message.reply_text) and wait until sent"""
+        group = message.chat.type in GROUP_CHATS
+        reply = Reply(message.get_bot(), message.chat_id, group, message.message_id if group else None)
+        await self._enqueue(reply, text)
+        return reply
+
+    async def send(self, bot, chat_id: int, text: str, group: bool = False) -> Reply:
+        """Send a new message to a chat and wait until sent"""
+        reply = Reply(bot, chat_id, group)
+        await self._enqueue(reply, text)
+        return reply
+
+    def edit(self, reply: Reply, text: str) -> asyncio.Future:
+        """Queue new text for a reply; await the result to know it was delivered.
+        Replaces the text of the reply's send or edit if that has not gone out yet."""
+        jobs = self._queues.get(reply.chat_id)
+        if jobs:
+            for job in reversed(jobs):
+                if job.reply is reply:
+                    job.text = text
+                    self.coalesced += 1
+                    return job.future
+        return self._enqueue(reply, text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'chats': len(self._queues),
+            'queued': sum(len(jobs) for jobs in self._queues.values()),
+            'sent': self.sent,
+            'edited': self.edited,
+            'deleted': self.deleted,
+            'coalesced': self.coalesced,
+            'retry_afters': self.retry_afters,
+            'failed': self.failed
+        }
+
+    def _enqueue(self, reply: Reply, text: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume)
+        jobs = self._queues.get(reply.chat_id)
+        if jobs is None:
+            jobs = self._queues[reply.chat_id] = deque()
+            task = asyncio.ensure_future(self._drain(reply.chat_id, jobs))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        jobs.append(_Job(reply, text, future))
+        return future
+
+    async def _drain(self, chat_id: int, jobs: Deque[_Job]):
+        try:
+            while jobs:
+                # Off the queue before it goes out, so later edits queue behind it
+                job = jobs.popleft()
+                try:
+                    await self._deliver(job.reply, job.text)
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"Message to chat {chat_id} failed: {e}")
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(job.reply)
+        finally:
+            del self._queues[chat_id]
+
+    async def _deliver(self, reply: Reply, text: str):
+        """Bring the reply's messages in line with `text`: edit, send or delete parts"""
+        parts = split_long_message(text)
+        for i, part in enumerate(parts):
+            if i < len(reply.messages):
+                if reply.parts[i] != part:
+                    await self._call(reply, reply.bot.edit_message_text, text=part, chat_id=reply.chat_id,
+                                     message_id=reply.messages[i].message_id)
+                    reply.parts[i] = part
+                    self.edited += 1
+            else:
+                message = await self._call(reply, reply.bot.send_message, chat_id=reply.chat_id, text=part,
+                                           reply_to_message_id=reply.reply_to if i == 0 else None)
+                reply.messages.append(message)
+                reply.parts.append(part)
+                self.sent += 1
+        while len(reply.messages) > len(parts):
+            await self._call(reply, reply.bot.delete_message, chat_id=reply.chat_id,
+                             message_id=reply.messages[-1].message_id)
+            reply.messages.pop()
+            reply.parts.pop()
+            self.deleted += 1
+
+    async def _call(self, reply: Reply, method, **kwargs):
+        """One Bot API call under the rate limits, retried after flood-control waits"""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(reply)
+            try:
+                return await method(**kwargs)
+            except RetryAfter as e:
+                self.retry_afters += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Flood control on chat {reply.chat_id}, retrying in {e.retry_after}s")
+                # Only this chat's queue waits; other chats keep going
+                await asyncio.sleep(float(e.retry_after))
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    return None
+                raise
+
+    async def _acquire(self, reply: Reply):
+        bucket = self._bucket(reply)
+        while True:
+            wait = bucket.try_take()
+            if not wait:
+                wait = self.global_bucket.try_take()
+                if not wait:
+                    return
+                bucket.give_back(1.0)
+            await asyncio.sleep(wait)
+
+    def _bucket(self, reply: Reply) -> TokenBucket:
+        bucket = self.buckets.get(reply.chat_id)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_IDLE_BUCKETS:
+                # Forget chats whose buckets have fully refilled (they are idle)
+                for chat_id in [cid for cid, b in self.buckets.items() if b.full]:
+                    del self.buckets[chat_id]
+            if reply.group:
+                bucket = TokenBucket(self.group_rate, max(1.0, min(self.chat_burst, self.group_rate * 60)))
+            else:
+                bucket = TokenBucket(self.chat_rate, max(1.0, self.chat_burst))
+            self.buckets[reply.chat_id] = bucket
+        return bucket
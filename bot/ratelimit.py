@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+CHEAP = 'cheap'
+EXPENSIVE = 'expensive'
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1.0, floor: float = 0.0) -> float:
+        """Take `cost` tokens if that leaves at least `floor`.
+
+        Returns 0 on success, otherwise the seconds until it would succeed.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        needed = cost + floor
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        if needed > self.capacity or self.rate <= 0:
+            return math.inf
+        return (needed - self.tokens) / self.rate
+
+    def give_back(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+    @property
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """
+    Per-user plus global token buckets with two priority classes.
+
+    Cheap requests (/start, /help, quick analysis) cost one token. Expensive
+    ones (/analyze, /humanize, voice) cost `expensive_cost` and may not dip
+    into the last `reserve` fraction of the global bucket, which keeps
+    headroom for cheap traffic when the bot is saturated.
+    """
+
+    MAX_IDLE_BUCKETS = 10000
+
+    def __init__(self, per_user_per_minute: int, global_per_minute: int,
+                 expensive_cost: float = 3.0, reserve: float = 0.2):
+        self.user_rate = per_user_per_minute / 60.0
+        # Buckets must hold at least one expensive request (plus the reserve),
+        # or low limits would refuse expensive requests forever
+        self.user_capacity = max(1.0, expensive_cost, per_user_per_minute / 2.0)
+        self.expensive_cost = expensive_cost
+        global_capacity = max(1.0, global_per_minute / 2.0)
+        if reserve < 1.0:
+            global_capacity = max(global_capacity, expensive_cost / (1.0 - reserve))
+        self.global_bucket = TokenBucket(global_per_minute / 60.0, global_capacity)
+        self.reserve = self.global_bucket.capacity * reserve
+        self.users: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.allowed = {CHEAP: 0, EXPENSIVE: 0}
+        self.limited = {CHEAP: 0, EXPENSIVE: 0}
+
+    def check(self, user_id: Optional[int], priority: str = CHEAP) -> float:
+        """Admit a request, returning 0, or the seconds the caller should wait"""
+        cost = self.expensive_cost if priority == EXPENSIVE else 1.0
+        floor = self.reserve if priority == EXPENSIVE else 0.0
+        with self._lock:
+            user_bucket = None
+            if user_id is not None:
+                user_bucket = self.users.get(user_id)
+                if user_bucket is None:
+                    self._prune()
+                    user_bucket = TokenBucket(self.user_rate, self.user_capacity)
+                    self.users[user_id] = user_bucket
+                wait = user_bucket.try_take(cost)
+                if wait:
+                    self.limited[priority] += 1
+                    return wait
+
+            wait = self.global_bucket.try_take(cost, floor)
+            if wait:
+                if user_bucket is not None:
+                    user_bucket.give_back(cost)
+                self.limited[priority] += 1
+                return wait
+
+            self.allowed[priority] += 1
+            return 0.0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'tracked_users': len(self.users),
+                'global_tokens': round(self.global_bucket.tokens, 1),
+                'allowed': dict(self.allowed),
+                'limited': dict(self.limited)
+            }
+
+    def _prune(self):
+        """Forget users whose buckets have fully refilled (they are idle)"""
+        if len(self.users) < self.MAX_IDLE_BUCKETS:
+            return
+        for user_id in [uid for uid, bucket in self.users.items() if bucket.full]:
+            del self.users[user_id]
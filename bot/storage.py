@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage:
+    """Interface for ConversationMemory persistence backends"""
+
+    def load_user(self, user_id: int) -> Dict[str, Tuple[Any, Optional[float]]]:
+        """Return {key: (value, expires_at)} for a user's unexpired entries"""
+        raise NotImplementedError
+
+    def put(self, user_id: int, key: str, value: Any, expires_at: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete_user(self, user_id: int):
+        raise NotImplementedError
+
+    def iter_users(self) -> Iterator[int]:
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JSONFileStorage(MemoryStorage):
+    """
+    Legacy whole-file JSON store (the original memory.json format).
+
+    Every write rewrites the whole file, so this is only kept as a migration
+    source and for small single-process setups. Key TTLs are not persisted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[int, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.data = {int(k): v for k, v in json.load(f).items()}
+            except Exception as e:
+                logger.error(f"Failed to load memory: {e}")
+
+    def load_user(self, user_id: int) -> Dict[str, Tuple[Any, Optional[float]]]:
+        return {key: (value, None) for key, value in self.data.get(user_id, {}).items()}
+
+    def put(self, user_id: int, key: str, value: Any, expires_at: Optional[float] = None):
+        self.data.setdefault(user_id, {})[key] = value
+        self._save()
+
+    def delete_user(self, user_id: int):
+        if self.data.pop(user_id, None) is not None:
+            self._save()
+
+    def iter_users(self) -> Iterator[int]:
+        return iter(list(self.data))
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Failed to save memory: {e}")
+
+
+class SQLiteStorage(MemoryStorage):
+    """
+    Per-key SQLite store in WAL mode.
+
+    Each store() is a single-row upsert. Commits are debounced: writes made
+    within `flush_interval` seconds share one commit (and one fsync), done by
+    a background thread, which also purges expired keys and checkpoints and
+    truncates the WAL every `compact_interval` seconds. Users are read
+    lazily, one at a time.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0,
+                 compact_interval: float = 3600.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level='DEFERRED')
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memory ("
+            " user_id INTEGER NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " expires_at REAL,"
+            " PRIMARY KEY (user_id, key))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(memory)")}
+        if 'expires_at' not in columns:
+            self._conn.execute("ALTER TABLE memory ADD COLUMN expires_at REAL")
+        self._conn.commit()
+
+        self._thread = threading.Thread(target=self._background, name='memory-flush', daemon=True)
+        self._thread.start()
+
+    def load_user(self, user_id: int) -> Dict[str, Tuple[Any, Optional[float]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value, expires_at FROM memory "
+                "WHERE user_id = ? AND (expires_at IS NULL OR expires_at >= ?)",
+                (user_id, time.time())
+            ).fetchall()
+        return {key: (json.loads(value), expires_at) for key, value, expires_at in rows}
+
+    def put(self, user_id: int, key: str, value: Any, expires_at: Optional[float] = None):
+        encoded = json.dumps(value, separators=(',', ':'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO memory (user_id, key, value, updated_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value, "
+                "updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+                (user_id, key, encoded, time.time(), expires_at)
+            )
+            self._dirty = True
+
+    def delete_user(self, user_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM memory WHERE user_id = ?", (user_id,))
+            self._dirty = True
+
+    def iter_users(self) -> Iterator[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM memory").fetchall()
+        return (row[0] for row in rows)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM memory LIMIT 1").fetchone() is None
+
+    def import_from(self, source: MemoryStorage) -> int:
+        """Copy every user from another backend, returning the number of users"""
+        count = 0
+        for user_id in source.iter_users():
+            for key, (value, expires_at) in source.load_user(user_id).items():
+                self.put(user_id, key, value, expires_at)
+            count += 1
+        self.flush()
+        return count
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self._conn.commit()
+                self._dirty = False
+
+    def compact(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM memory WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            )
+            self._conn.commit()
+            self._dirty = False
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self._closed.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def _background(self):
+        last_compact = time.monotonic()
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_compact >= self.compact_interval:
+                    self.compact()
+                    last_compact = time.monotonic()
+            except Exception as e:
+                logger.error(f"Memory flush failed: {e}")
+
+
+def create_storage(backend: str, db_path: str, legacy_path: Optional[str] = None,
+                   flush_interval: float = 1.0, compact_interval: float = 3600.0) -> MemoryStorage:
+    """Build the configured backend, migrating a legacy JSON file into SQLite once"""
+    if backend == 'json':
+        return JSONFileStorage(legacy_path or db_path)
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown memory backend: {backend}")
+
+    storage = SQLiteStorage(db_path, flush_interval, compact_interval)
+    if legacy_path and os.path.exists(legacy_path) and storage.is_empty():
+        migrated = storage.import_from(JSONFileStorage(legacy_path))
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        logger.info(f"Migrated {migrated} users from {legacy_path} to {db_path}")
+    return storage
@@ -0,0 +1,275 @@
+"""
+Async translation service with request coalescing, caching and a circuit breaker.
+
+Concurrent `translate` calls for the same language pair are merged into one
+bulk backend call, identical texts share a single slot in that call, and
+results are cached by (text hash, source, target). Backend calls are timed
+out, and repeated failures open a circuit breaker so requests fail fast (or
+go to a fallback backend) instead of piling up on a dead endpoint.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bot.cache import ResultCache
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TranslationError(RuntimeError):
+    """Raised when a text could not be translated"""
+
+
+class CircuitOpenError(TranslationError):
+    """Raised while the circuit breaker is refusing backend calls"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and stays open for
+    `reset_timeout` seconds; then one trial call is let through (half-open)
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+
+class TranslationBackend:
+    """Translates a list of texts in one call; blocking, run off the event loop"""
+
+    name = 'base'
+    # False for stand-ins that hand texts back untranslated
+    translates = True
+
+    def translate_batch(self, texts: List[str], source: Optional[str],
+                        target: str) -> List[Tuple[str, str]]:
+        """Return (translated text, source language code) for every text"""
+        raise NotImplementedError
+
+
+class GoogleTranslateBackend(TranslationBackend):
+    """googletrans (unofficial Google Translate endpoint)"""
+
+    name = 'google'
+
+    def __init__(self, timeout: float = 10.0):
+        from googletrans import Translator
+        self.translator = Translator(timeout=timeout)
+
+    def translate_batch(self, texts, source, target):
+        results = self.translator.translate(texts, dest=target, src=source or 'auto')
+        return [(result.text, result.src) for result in results]
+
+
+class LocalBackend(TranslationBackend):
+    """
+    Offline stand-in: returns texts untranslated, tagged with their locally
+    detected language. Only for tests and offline runs as the primary
+    backend; it cannot be a fallback, since users would get their own text
+    back as if it were a translation.
+    """
+
+    name = 'local'
+    translates = False
+
+    def __init__(self):
+        from bot.language import LanguageDetector
+        self.detector = LanguageDetector()
+
+    def translate_batch(self, texts, source, target):
+        return [(text, source or self.detector.detect(text)[0] or 'und') for text in texts]
+
+
+BACKENDS = {
+    'google': GoogleTranslateBackend,
+    'local': LocalBackend,
+}
+
+
+def create_backend(name: str) -> TranslationBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class TranslationService:
+    def __init__(self, backend: TranslationBackend, fallback: Optional[TranslationBackend] = None,
+                 max_batch_size: int = 16, max_wait_ms: float = 20.0, timeout: float = 10.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        if fallback is not None and not fallback.translates:
+            raise ValueError(f"Translation backend '{fallback.name}' does not translate and cannot be a fallback")
+        self.backend = backend
+        self.fallback = fallback
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = ResultCache('translate', version=backend.name)
+
+        # (source, target) -> {text: [futures waiting for it]}
+        self._pending: Dict[Tuple[Optional[str], str], Dict[str, List[asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[Optional[str], str], asyncio.TimerHandle] = {}
+        self._tasks = set()
+        self.requests = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.degraded = 0
+
+    async def translate(self, text: str, target: str = 'en',
+                        source: Optional[str] = None) -> Tuple[str, str]:
+        """Translate one text, returning (translation, source language code)"""
+        self.requests += 1
+        cached = self.cache.get(self.cache.key(text, source, target), _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        group = (source, target)
+        waiters = self._pending.setdefault(group, {})
+        future = loop.create_future()
+        waiters.setdefault(text, []).append(future)
+        if len(waiters) >= self.max_batch_size:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self.max_wait, self._flush, group)
+        return await future
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'backend': self.backend.name,
+            'requests': self.requests,
+            'batches': self.batches,
+            'avg_batch_size': self.batched_texts / self.batches if self.batches else 0.0,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'degraded': self.degraded,
+            'breaker': self.breaker.state,
+            'breaker_trips': self.breaker.trips
+        }
+
+    def _flush(self, group):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        waiters = self._pending.pop(group, None)
+        if waiters:
+            task = asyncio.ensure_future(self._run_batch(group, waiters))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, group, waiters: Dict[str, List[asyncio.Future]]):
+        source, target = group
+        texts = list(waiters)
+        self.batches += 1
+        self.batched_texts += len(texts)
+        try:
+            results, cacheable = await self._call(texts, source, target)
+        except Exception as e:
+            error = e if isinstance(e, TranslationError) else TranslationError(str(e))
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+            return
+
+        for text, result in zip(texts, results):
+            if cacheable:
+                self.cache.set(self.cache.key(text, source, target), result)
+            for future in waiters[text]:
+                if not future.done():
+                    future.set_result(result)
+
+    async def _call(self, texts: List[str], source: Optional[str],
+                    target: str) -> Tuple[List[Tuple[str, str]], bool]:
+        """Bulk call to the backend, or the fallback while it is failing.
+        Returns the results and whether they are real translations worth caching."""
+        if self.breaker.allow():
+            try:
+                results = await asyncio.wait_for(
+                    asyncio.to_thread(self.backend.translate_batch, texts, source, target),
+                    self.timeout
+                )
+                if len(results) != len(texts):
+                    raise TranslationError(f"Backend returned {len(results)} results for {len(texts)} texts")
+            except Exception as e:
+                self.breaker.record_failure()
+                self.failures += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                    e = TranslationError(f"Translation timed out after {self.timeout}s")
+                logger.warning(f"Translation backend '{self.backend.name}' failed: {e}")
+                if self.fallback is None:
+                    if isinstance(e, TranslationError):
+                        raise e
+                    raise TranslationError(str(e)) from e
+            else:
+                self.breaker.record_success()
+                return results, True
+        elif self.fallback is None:
+            raise CircuitOpenError(f"Translation backend '{self.backend.name}' is unavailable")
+
+        self.degraded += len(texts)
+        try:
+            results = await asyncio.wait_for(
+                asyncio.to_thread(self.fallback.translate_batch, texts, source, target),
+                self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TranslationError(f"Fallback translation timed out after {self.timeout}s")
+        return results, False
+
+
+def create_service() -> TranslationService:
+    """Translation service configured from Config"""
+    fallback = create_backend(Config.TRANSLATION_FALLBACK) if Config.TRANSLATION_FALLBACK else None
+    return TranslationService(
+        create_backend(Config.TRANSLATION_BACKEND),
+        fallback=fallback,
+        max_batch_size=Config.TRANSLATION_BATCH_SIZE,
+        max_wait_ms=Config.TRANSLATION_BATCH_WAIT_MS,
+        timeout=Config.TRANSLATION_TIMEOUT,
+        breaker=CircuitBreaker(Config.TRANSLATION_BREAKER_FAILURES, Config.TRANSLATION_BREAKER_RESET)
+    )
@@ -1,35 +1,77 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
+from bot.config import Config
 
-def format_analysis(analysis: Dict[str, Any]) -> str:
-    """Format analysis results for Telegram message"""
-    entities = "\n".join(
-        f"- {e['word']} ({e['entity']}, confidence: {e['score']:.2f})" 
-        for e in analysis['entities'][:5]
-    )
-    
-    return (
-        f"🔍 Deep Analysis Report\n\n"
-        f"📊 Sentiment: {analysis['sentiment']['label']} (confidence: {analysis['sentiment']['score']:.2f})\n"
-        f"🎭 Deception Score: {analysis['deception_score']:.2f}/1.00\n\n"
-        f"🏷️ Top Entities:\n{entities}\n\n"
-        f"🧠 AI Insights:\n{analysis['insights']}\n\n"
-        f"✍️ Writing Patterns:\n"
-        f"- Avg. sentence length: {analysis['writing_patterns']['avg_sentence_length']:.1f} chars\n"
-        f"- Word diversity: {analysis['writing_patterns']['word_diversity']:.2f}"
-    )
+# Hard limit of the Bot API on a message's text
+TELEGRAM_MAX_LENGTH = 4096
 
-def split_long_message(text: str, max_length: int = 4000) -> List[str]:
-    """Split long text into chunks for Telegram messages"""
+def format_analysis(analysis: Dict[str, Any], pending: Iterable[str] = ()) -> str:
+    """Format analysis results for Telegram message.
+    Sections missing from a partial (tiered) analysis are skipped and the
+    stages still running are listed at the end."""
+    lines = ["🔍 Deep Analysis Report\n"]
+    
+    if 'sentiment' in analysis:
+        lines.append(
+            f"📊 Sentiment: {analysis['sentiment']['label']} "
+            f"(confidence: {analysis['sentiment']['score']:.2f})"
+        )
+    if 'deception_score' in analysis:
+        lines.append(f"🎭 Deception Score: {analysis['deception_score']:.2f}/1.00")
+    
+    if analysis.get('entities'):
+        entities = "\n".join(
+            f"- {e['word']} ({e['entity']}, confidence: {e['score']:.2f})" if e['score'] is not None
+            else f"- {e['word']} ({e['entity']})"
+            for e in analysis['entities'][:5]
+        )
+        lines.append(f"\n🏷️ Top Entities:\n{entities}")
+    
+    if 'insights' in analysis:
+        lines.append(f"\n🧠 AI Insights:\n{analysis['insights']}")
+    
+    if 'writing_patterns' in analysis:
+        lines.append(
+            f"\n✍️ Writing Patterns:\n"
+            f"- Avg. sentence length: {analysis['writing_patterns']['avg_sentence_length']:.1f} chars\n"
+            f"- Word diversity: {analysis['writing_patterns']['word_diversity']:.2f}"
+        )
+    
+    if analysis.get('incomplete'):
+        lines.append(f"\n⚠️ Skipped (too slow or failed): {', '.join(analysis['incomplete'])}")
+    
+    if 'analyzed_chars' in analysis:
+        lines.append(f"\nℹ️ Long text: only the first {analysis['analyzed_chars']} characters were analyzed.")
+    
+    pending = list(pending)
+    if pending:
+        lines.append(f"\n⏳ Still working on: {', '.join(pending)}...")
+    
+    return "\n".join(lines)
+
+def split_long_message(text: str, max_length: Optional[int] = None) -> List[str]:
+    """Split long text into chunks for Telegram messages.
+    Breaks at the last newline, else the last space, in the back half of
+    each window (a hard cut if there is neither), in one pass over the text."""
+    max_length = min(max_length or Config.MESSAGE_CHAR_LIMIT, TELEGRAM_MAX_LENGTH)
     if len(text) <= max_length:
         return [text]
     
     parts = []
-    while text:
-        part = text[:max_length]
-        last_newline = part.rfind('\n')
-        if last_newline > 0:
-            part = part[:last_newline]
-        parts.append(part)
-        text = text[len(part):].lstrip()
-    
-    return parts
+    start = 0
+    while start < len(text):
+        end = start + max_length
+        if end >= len(text):
+            parts.append(text[start:])
+            break
+        floor = start + max_length // 2
+        cut = text.rfind('\n', floor, end)
+        if cut < 0:
+            cut = text.rfind(' ', floor, end)
+        if cut < 0:
+            cut = end
+        parts.append(text[start:cut].rstrip())
+        start = cut
+        while start < len(text) and text[start].isspace():
+            start += 1
+    
+    return [part for part in parts if part]
@@ -1,27 +1,260 @@
-import os
+import asyncio
+import json
+import logging
+import subprocess
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
 import speech_recognition as sr
-from pydub import AudioSegment
-from typing import Optional
+from bot.config import Config
+from bot.executor import BoundedPool
+from bot.lazy import lazy_property
+from bot.metrics import STAGE_LATENCY
+from bot.ratelimit import EXPENSIVE
 
-class VoiceProcessor:
-    def __init__(self):
+logger = logging.getLogger(__name__)
+
+SAMPLE_WIDTH = 2  # bytes per sample (s16le)
+
+
+class AudioDecodeError(RuntimeError):
+    """Raised when ffmpeg cannot decode a voice note"""
+
+
+class RecognizerBackend:
+    """Speech-to-text engine for one chunk of 16-bit mono PCM"""
+
+    name = 'base'
+    local = False  # True when the engine runs on this machine's CPU
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """Return the transcript, or '' when no speech was recognised"""
+        raise NotImplementedError
+
+    def warm_up(self):
+        pass
+
+
+class GoogleRecognizer(RecognizerBackend):
+    """Google Web Speech API (network)"""
+
+    name = 'google'
+
+    def __init__(self, language: str = 'en-US'):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            return ''
+
+
+class VoskRecognizer(RecognizerBackend):
+    """Offline Kaldi recognizer; needs a downloaded Vosk model directory"""
+
+    name = 'vosk'
+    local = True
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    @lazy_property
+    def model(self):
+        import vosk
+        vosk.SetLogLevel(-1)
+        return vosk.Model(self.model_path)
+
+    def warm_up(self):
+        self.model
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        import vosk
+        # The model is shared; each call gets its own (cheap) recognizer
+        recognizer = vosk.KaldiRecognizer(self.model, audio.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_width=SAMPLE_WIDTH))
+        return json.loads(recognizer.FinalResult()).get('text', '')
+
+
+class WhisperRecognizer(RecognizerBackend):
+    """Offline OpenAI Whisper model through SpeechRecognition's recognize_whisper"""
+
+    name = 'whisper'
+    local = True
+
+    def __init__(self, model: str = 'base', language: str = 'en-US'):
+        self.model = model
+        self.language = language.split('-')[0]
         self.recognizer = sr.Recognizer()
-        
-    def to_text(self, audio_path: str) -> Optional[str]:
-        """Convert voice message to text"""
+
+    def warm_up(self):
+        # recognize_whisper loads the model once and keeps it on the recognizer
+        self.transcribe(sr.AudioData(b'\0\0' * 1600, 16000, SAMPLE_WIDTH))
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        try:
+            return self.recognizer.recognize_whisper(audio, model=self.model, language=self.language).strip()
+        except sr.UnknownValueError:
+            return ''
+
+
+def create_recognizer(name: str) -> RecognizerBackend:
+    if name == 'google':
+        return GoogleRecognizer(Config.VOICE_LANGUAGE)
+    if name == 'vosk':
+        return VoskRecognizer(Config.VOSK_MODEL_PATH)
+    if name == 'whisper':
+        return WhisperRecognizer(Config.WHISPER_MODEL, Config.VOICE_LANGUAGE)
+    raise ValueError(f"Unknown speech backend '{name}', expected google, vosk or whisper")
+
+
+def split_on_silence(pcm: bytes, sample_rate: int, min_silence_ms: int = 500,
+                     silence_db: float = -40.0, max_chunk_seconds: float = 20.0,
+                     frame_ms: int = 30) -> List[Tuple[int, int]]:
+    """
+    Find speech segments in 16-bit mono PCM, as (start, end) byte offsets.
+
+    Frame loudness is computed for the whole clip at once; segments are cut
+    in the middle of every pause of at least `min_silence_ms`, overlong ones
+    at their quietest frame, and all-silent segments are dropped.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    frame = max(1, sample_rate * frame_ms // 1000)
+    n_frames = len(samples) // frame
+    if n_frames < 2:
+        return [(0, len(pcm))] if len(pcm) else []
+
+    frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float32)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1)) / 32768.0
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    silent = db < silence_db
+
+    # Runs of silent frames: starts where silent goes 0 -> 1, ends where 1 -> 0
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_frames = max(1, min_silence_ms // frame_ms)
+    cuts = [int(start + end) // 2 for start, end in zip(run_starts, run_ends)
+            if end - start >= min_frames and start > 0 and end < n_frames]
+
+    max_frames = max(2, int(max_chunk_seconds * 1000 // frame_ms))
+    bounds = []
+    for start, end in zip([0] + cuts, cuts + [n_frames]):
+        while end - start > max_frames:
+            window = db[start + max_frames // 2:start + max_frames]
+            cut = start + max_frames // 2 + int(np.argmin(window))
+            bounds.append((start, cut))
+            start = cut
+        bounds.append((start, end))
+
+    segments = []
+    for start, end in bounds:
+        if silent[start:end].all():
+            continue
+        end_byte = len(pcm) if end == n_frames else end * frame * SAMPLE_WIDTH
+        segments.append((start * frame * SAMPLE_WIDTH, end_byte))
+    return segments
+
+
+class VoiceProcessor:
+    def __init__(self, backend: Optional[RecognizerBackend] = None,
+                 sample_rate: Optional[int] = None, max_seconds: Optional[float] = None,
+                 pools: Optional[Dict[str, BoundedPool]] = None):
+        self.backend = backend or create_recognizer(Config.SPEECH_BACKEND)
+        self.sample_rate = sample_rate or Config.VOICE_SAMPLE_RATE
+        self.max_seconds = max_seconds or Config.VOICE_MAX_SECONDS
+        # Chunks are transcribed on the 'model' pool for local engines and the
+        # 'network' one for remote APIs; the bot passes the InferenceExecutor's,
+        # so a burst of voice notes is shed like any other overload
+        if pools is None:
+            pool = BoundedPool('speech', Config.VOICE_WORKERS, Config.NETWORK_QUEUE_SIZE,
+                               Config.EXPENSIVE_QUEUE_SHARE)
+            pools = {'model': pool, 'network': pool}
+        self.pools = pools
+
+    def warm_up(self):
+        self.backend.warm_up()
+
+    def decode(self, data: bytes) -> sr.AudioData:
+        """
+        Decode an OGG/Opus voice note to mono 16-bit PCM entirely in memory.
+
+        ffmpeg reads the note from stdin and writes raw samples, already
+        resampled to `sample_rate`, to stdout; nothing touches the disk.
+        Output stops at `max_seconds`, which caps the PCM buffer size.
+        """
+        command = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-t', str(self.max_seconds),
+            '-f', 's16le', '-acodec', 'pcm_s16le',
+            '-ac', '1', '-ar', str(self.sample_rate),
+            'pipe:1'
+        ]
+        try:
+            with STAGE_LATENCY.time(component='voice', stage='decode'):
+                result = subprocess.run(
+                    command, input=data, capture_output=True,
+                    timeout=Config.VOICE_DECODE_TIMEOUT, check=False
+                )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AudioDecodeError(f"ffmpeg failed: {e}") from e
+        if result.returncode != 0 or not result.stdout:
+            raise AudioDecodeError(
+                f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()[:200]}"
+            )
+        return sr.AudioData(result.stdout, self.sample_rate, SAMPLE_WIDTH)
+
+    def prepare(self, data: bytes) -> List[sr.AudioData]:
+        """Decode a voice note and split it on silence into chunks to transcribe"""
+        audio = self.decode(data)
+        pcm = audio.get_raw_data()
+        with STAGE_LATENCY.time(component='voice', stage='split'):
+            segments = split_on_silence(
+                pcm, audio.sample_rate, Config.VOICE_MIN_SILENCE_MS,
+                Config.VOICE_SILENCE_DB, Config.VOICE_MAX_CHUNK_SECONDS
+            )
+        return [sr.AudioData(pcm[start:end], audio.sample_rate, SAMPLE_WIDTH) for start, end in segments]
+
+    def transcribe_chunks(self, chunks: List[sr.AudioData]) -> str:
+        """Transcribe chunks in parallel on the speech pool and join them in order"""
+        return ' '.join(text for text in (future.result() for future in self._submit(chunks)) if text)
+
+    async def stream_text(self, chunks: List[sr.AudioData]) -> AsyncIterator[str]:
+        """Yield the growing transcript as the chunks (transcribed in parallel) finish in order"""
+        futures = self._submit(chunks)
+        parts = []
+        try:
+            for future in futures:
+                text = await asyncio.wrap_future(future)
+                if text:
+                    parts.append(text)
+                    yield ' '.join(parts)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _submit(self, chunks: List[sr.AudioData]) -> List[Future]:
+        """Queue every chunk, or none: QueueFullError if the pool cannot take them all"""
+        pool = self.pools['model' if self.backend.local else 'network']
+        futures: List[Future] = []
+        try:
+            for chunk in chunks:
+                futures.append(pool.submit(lambda chunk=chunk: self._transcribe(chunk), EXPENSIVE))
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def _transcribe(self, chunk: sr.AudioData) -> str:
+        with STAGE_LATENCY.time(component='voice', stage='transcribe'):
+            return self.backend.transcribe(chunk)
+
+    def to_text(self, data: bytes) -> Optional[str]:
+        """Convert voice message (raw OGG/Opus bytes) to text"""
         try:
-            # Convert OGG to WAV
-            sound = AudioSegment.from_ogg(audio_path)
-            wav_path = audio_path.replace('.ogg', '.wav')
-            sound.export(wav_path, format="wav")
-            
-            # Recognize speech
-            with sr.AudioFile(wav_path) as source:
-                audio = self.recognizer.record(source)
-                text = self.recognizer.recognize_google(audio)
-            
-            os.remove(wav_path)
-            return text
+            return self.transcribe_chunks(self.prepare(data))
         except Exception as e:
-            print(f"Voice processing failed: {e}")
+            logger.error(f"Voice processing failed: {e}")
             return None
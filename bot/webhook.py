@@ -0,0 +1,224 @@
+"""
+Webhook mode: a plain ASGI app that receives Telegram updates over HTTPS.
+
+Telegram POSTs every update to WEBHOOK_PATH. The app validates it, puts it
+on a bounded queue and answers immediately; a fixed pool of worker tasks
+feeds the queue into the python-telegram-bot Application. When the queue is
+full the app answers 503 and Telegram redelivers the update later. On
+shutdown (SIGTERM from gunicorn/uvicorn/Heroku) new updates are refused and
+the queue is drained before the Application stops.
+
+Run it with
+    uvicorn bot.main:application --port 8443
+Prometheus metrics are served on GET /metrics when METRICS_TOKEN is set,
+to scrapers sending `Authorization: Bearer <METRICS_TOKEN>`; otherwise use
+METRICS_PORT, which should not be exposed publicly. Test locally by POSTing
+fake updates:
+    curl -X POST localhost:8443/telegram -H 'Content-Type: application/json' \
+         -d '{"update_id": 1, "message": {...}}'
+"""
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from telegram import Update
+
+from bot.config import Config
+from bot.metrics import render
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+SECRET_HEADER = b'x-telegram-bot-api-secret-token'
+
+
+class WebhookApp:
+    def __init__(self, build_application: Callable[[], Any], path: Optional[str] = None,
+                 queue_size: Optional[int] = None, workers: Optional[int] = None,
+                 drain_timeout: Optional[float] = None, secret: Optional[str] = None):
+        self.build_application = build_application
+        self.path = path or Config.WEBHOOK_PATH
+        self.queue_size = queue_size or Config.WEBHOOK_QUEUE_SIZE
+        self.workers = workers or Config.WEBHOOK_WORKERS
+        self.drain_timeout = Config.WEBHOOK_DRAIN_TIMEOUT if drain_timeout is None else drain_timeout
+        self.secret = Config.WEBHOOK_SECRET if secret is None else secret
+        if not self.secret and Config.WEBHOOK_URL:
+            # Without one anybody could POST forged updates (e.g. from an admin id).
+            # Set WEBHOOK_SECRET when running several workers: each would generate its own.
+            self.secret = secrets.token_urlsafe(32)
+            logger.info("WEBHOOK_SECRET is not set; registering the webhook with a generated secret")
+
+        self.application = None
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.ready = False
+        self.draining = False
+        self.started_at = 0.0
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def startup(self):
+        """Build and start the Telegram application and the update workers"""
+        self.application = self.build_application()
+        await self.application.initialize()
+        if self.application.post_init:
+            await self.application.post_init(self.application)
+        await self.application.start()
+
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if Config.WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip('/') + self.path,
+                secret_token=self.secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=min(100, self.workers * 2)
+            )
+        self.started_at = time.monotonic()
+        self.ready = True
+        if not self.secret:
+            logger.warning("WEBHOOK_SECRET is not set: updates on the webhook are not authenticated")
+        logger.info(f"Webhook listening on {self.path} with {self.workers} workers")
+
+    async def shutdown(self):
+        """Stop accepting updates, finish the queued ones, then stop the application"""
+        self.draining = True
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Drain timed out with {self.queue.qsize()} updates still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.application is not None:
+            await self.application.stop()
+            await self.application.shutdown()
+        self.ready = False
+        logger.info(f"Webhook stopped after processing {self.processed} updates")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'draining': self.draining,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'queue_size': self.queue_size,
+            'workers': self.workers,
+            'received': self.received,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+            'uptime_s': round(time.monotonic() - self.started_at, 1) if self.ready else 0.0
+        }
+
+    async def _worker(self, number: int):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Webhook worker {number} failed on update {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.error(f"Webhook startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope['method'], scope['path']
+        if path == '/health' and method in ('GET', 'HEAD'):
+            status = 200 if self.ready and not self.draining else 503
+            await _respond(send, status, self.stats())
+        elif path == '/metrics' and method == 'GET' and Config.METRICS_TOKEN:
+            authorization = dict(scope['headers']).get(b'authorization', b'')
+            if not hmac.compare_digest(authorization, f'Bearer {Config.METRICS_TOKEN}'.encode()):
+                await _respond(send, 401, {'error': 'bad metrics token'})
+                return
+            body = render().encode('utf-8')
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/plain; version=0.0.4'),
+                (b'content-length', str(len(body)).encode())
+            ]})
+            await send({'type': 'http.response.body', 'body': body})
+        elif path == self.path and method == 'POST':
+            await self._receive_update(scope, receive, send)
+        else:
+            await _respond(send, 404, {'error': 'not found'})
+
+    async def _receive_update(self, scope, receive, send):
+        if self.secret and not hmac.compare_digest(dict(scope['headers']).get(SECRET_HEADER, b''),
+                                                    self.secret.encode()):
+            await _respond(send, 403, {'error': 'bad secret token'})
+            return
+        if not self.ready or self.draining:
+            await _respond(send, 503, {'error': 'not accepting updates'}, retry_after=5)
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            await _respond(send, 413, {'error': 'body too large'})
+            return
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            await _respond(send, 400, {'error': f'invalid update: {e}'})
+            return
+
+        self.received += 1
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"Update queue full, rejecting update {update.update_id}")
+            await _respond(send, 503, {'error': 'busy'}, retry_after=1)
+            return
+        await _respond(send, 200, {'ok': True})
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _respond(send, status: int, payload: Dict[str, Any], retry_after: Optional[int] = None):
+    body = json.dumps(payload).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if retry_after is not None:
+        headers.append((b'retry-after', str(retry_after).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,6 @@
+import os
+
+# bot.config validates these on import; the tests never talk to Telegram or OpenAI
+os.environ.setdefault('TELEGRAM_TOKEN', 'test-token')
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+os.environ.setdefault('ENABLE_VOICE', 'false')
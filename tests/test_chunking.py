@@ -0,0 +1,119 @@
+import pytest
+
+from bot.chunking import aggregate_entities, aggregate_sentiment, iter_chunks
+
+
+def words(piece):
+    return len(piece.split())
+
+
+def utf8_bytes(piece):
+    # Stands in for a tokenizer that yields more tokens than characters
+    return len(piece.encode('utf-8'))
+
+
+class TestIterChunks:
+    def test_packs_whole_sentences(self):
+        text = "One two three. Four five. Six seven eight nine. Ten."
+        chunks = list(iter_chunks(text, words, 5))
+        assert chunks == ["One two three. Four five.", "Six seven eight nine. Ten."]
+
+    def test_short_text_is_one_chunk(self):
+        assert list(iter_chunks("Just one sentence.", words, 10)) == ["Just one sentence."]
+
+    def test_long_sentence_is_split_on_whitespace(self):
+        sentence = ' '.join(f"w{i}" for i in range(25)) + '.'
+        chunks = list(iter_chunks(sentence, words, 10))
+        assert [words(chunk) for chunk in chunks] == [10, 10, 5]
+        assert ' '.join(chunks) == sentence
+
+    def test_max_chunks(self):
+        text = ' '.join(f"Sentence {i}." for i in range(10))
+        assert len(list(iter_chunks(text, words, 2, max_chunks=3))) == 3
+
+    def test_word_longer_than_window_is_cut(self):
+        word = 'a' * 250
+        chunks = list(iter_chunks(word, len, 100))
+        assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+        assert ''.join(chunks) == word
+
+    @pytest.mark.parametrize('text', [
+        '数据分析' * 60,
+        'https://example.com/' + 'x' * 300,
+        'ok then ' + 'é' * 150 + ' done',
+    ])
+    def test_no_chunk_is_over_the_limit(self, text):
+        chunks = list(iter_chunks(text, utf8_bytes, 100))
+        assert chunks
+        assert all(utf8_bytes(chunk) <= 100 for chunk in chunks)
+        assert ''.join(''.join(chunks).split()) == ''.join(text.split())
+
+
+class TestAggregation:
+    def test_sentiment_is_length_weighted(self):
+        results = [{'label': 'POSITIVE', 'score': 0.9}, {'label': 'NEGATIVE', 'score': 0.8}]
+        assert aggregate_sentiment(results, [1, 3]) == {'label': 'NEGATIVE', 'score': pytest.approx(0.625)}
+        assert aggregate_sentiment(results, [3, 1]) == {'label': 'POSITIVE', 'score': pytest.approx(0.725)}
+
+    def test_single_chunk_sentiment_is_unchanged(self):
+        result = {'label': 'NEGATIVE', 'score': 0.7}
+        assert aggregate_sentiment([result], [42]) == {'label': 'NEGATIVE', 'score': pytest.approx(0.7)}
+
+    def test_entities_deduplicated_by_word_and_type(self):
+        merged = aggregate_entities([
+            [{'word': 'Paris', 'entity': 'LOC', 'score': 0.7}, {'word': 'Ann', 'entity': 'PER', 'score': 0.9}],
+            [{'word': 'Paris', 'entity': 'LOC', 'score': 0.95}, {'word': 'Paris', 'entity': 'PER', 'score': 0.4}],
+        ])
+        assert merged == [
+            {'word': 'Paris', 'entity': 'LOC', 'score': 0.95},
+            {'word': 'Ann', 'entity': 'PER', 'score': 0.9},
+            {'word': 'Paris', 'entity': 'PER', 'score': 0.4},
+        ]
+
+
+# A fixed lexicon "model" over a labelled fixture: each text opens with a
+# sentence of the other polarity, and its label is carried by what follows,
+# past the point where truncation cuts it off.
+POSITIVE_WORDS = {'great', 'love', 'wonderful', 'happy', 'excellent'}
+NEGATIVE_WORDS = {'awful', 'hate', 'terrible', 'sad', 'broken'}
+WINDOW = 12
+
+FIXTURE = [
+    ("I love the box it came in. " + "Sadly the device is broken and terrible. " * 4 + "I hate it.", 'NEGATIVE'),
+    ("The first week was awful. " + "Since the update it is great and wonderful. " * 4 + "Very happy.", 'POSITIVE'),
+    ("Support was excellent. " + "Still the battery is terrible and I am sad. " * 3, 'NEGATIVE'),
+    ("Shipping was terrible. " + "The screen is excellent and I love it. " * 3, 'POSITIVE'),
+    ("What a great day.", 'POSITIVE'),
+]
+
+
+def lexicon_model(chunk):
+    tokens = [token.strip('.,!?').lower() for token in chunk.split()]
+    positive = sum(token in POSITIVE_WORDS for token in tokens)
+    negative = sum(token in NEGATIVE_WORDS for token in tokens)
+    score = (positive + 1) / (positive + negative + 2)
+    return {'label': 'POSITIVE', 'score': score} if score >= 0.5 else {'label': 'NEGATIVE', 'score': 1 - score}
+
+
+def truncated_label(text):
+    return lexicon_model(' '.join(text.split()[:WINDOW]))['label']
+
+
+def chunked_label(text):
+    chunks = list(iter_chunks(text, words, WINDOW))
+    return aggregate_sentiment([lexicon_model(chunk) for chunk in chunks], [words(c) for c in chunks])['label']
+
+
+def test_chunking_beats_truncation_on_fixture():
+    truncated = sum(truncated_label(text) == label for text, label in FIXTURE)
+    chunked = sum(chunked_label(text) == label for text, label in FIXTURE)
+    assert chunked == len(FIXTURE)
+    assert truncated < chunked
+
+
+def test_chunking_cost_is_proportional_to_length():
+    # Model calls, the time that matters, grow with the text, not per sentence
+    for text, _ in FIXTURE:
+        chunks = list(iter_chunks(text, words, WINDOW))
+        assert len(chunks) <= -(-words(text) // WINDOW) * 2
+        assert all(words(chunk) <= WINDOW for chunk in chunks)
@@ -0,0 +1,20 @@
+import math
+
+import pytest
+
+from bot.ratelimit import CHEAP, EXPENSIVE, RateLimiter
+
+
+@pytest.mark.parametrize('per_user, per_global', [(4, 600), (1, 1), (60, 4)])
+def test_low_limits_still_admit_expensive_requests(per_user, per_global):
+    limiter = RateLimiter(per_user, per_global, expensive_cost=3.0, reserve=0.2)
+    assert limiter.check(1, EXPENSIVE) == 0.0
+    wait = limiter.check(1, EXPENSIVE)
+    assert 0.0 < wait < math.inf
+
+
+def test_expensive_requests_leave_the_reserve_to_cheap_ones():
+    limiter = RateLimiter(600, 20, expensive_cost=3.0, reserve=0.2)
+    admitted = [limiter.check(user, EXPENSIVE) == 0.0 for user in range(5)]
+    assert admitted == [True, True, False, False, False]
+    assert limiter.check(99, CHEAP) == 0.0